@@ -0,0 +1,108 @@
+# libraries
+import bisect
+import itertools
+
+
+# Price alert record
+class Alert:
+    __slots__ = ('id', 'level', 'direction', 'owner', 'payload')
+
+    def __init__(self, id, level, owner=None, payload=None):
+        self.id = id
+        self.level = level
+        self.direction = None # 'up' or 'down', set once the alert is placed against a price
+        self.owner = owner
+        self.payload = payload
+
+    def __repr__(self):
+        return f"Alert({self.id} {self.direction} {self.level})"
+
+
+# Sorted price-level trigger index
+class AlertBook:
+
+    def __init__(self):
+        """
+        Up-levels sit above the last price and fire when the price rises to them, down-levels sit
+        below and fire when it falls to them. Both sides are kept as sorted level arrays with a
+        parallel array of alerts, so every tick costs two bisects plus the alerts it actually fires.
+        """
+        self.up_levels, self.up_alerts = [], []
+        self.down_levels, self.down_alerts = [], []
+        self.pending = [] # added while no price is known, or exactly at the last price
+        self.alerts = {}
+        self.last = None
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def add(self, level, owner=None, payload=None):
+        alert = Alert(next(self._ids), float(level), owner, payload)
+        self.alerts[alert.id] = alert
+        self._place(alert, self.last)
+        return alert
+
+    def remove(self, alert_id):
+        alert = self.alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+
+        if alert.direction is None:
+            self.pending.remove(alert)
+            return alert
+
+        levels, alerts = (self.up_levels, self.up_alerts) if alert.direction == 'up' else (self.down_levels, self.down_alerts)
+        i = bisect.bisect_left(levels, alert.level)
+        while alerts[i] is not alert:
+            i += 1
+        del levels[i], alerts[i]
+        return alert
+
+    def remove_owner(self, owner):
+        return [self.remove(alert.id) for alert in list(self.alerts.values()) if alert.owner == owner]
+
+    def on_price(self, price):
+        """
+        Returns the alerts crossed between the previous and the current price, and drops them from the book.
+        """
+        fired = []
+        self.last = price
+
+        # up-levels are all above the previous price, fire the ones now at or below it
+        k = bisect.bisect_right(self.up_levels, price)
+        if k:
+            fired.extend(self.up_alerts[:k])
+            del self.up_levels[:k], self.up_alerts[:k]
+
+        # down-levels are all below the previous price, fire the ones now at or above it
+        k = bisect.bisect_left(self.down_levels, price)
+        if k < len(self.down_levels):
+            fired.extend(self.down_alerts[k:])
+            del self.down_levels[k:], self.down_alerts[k:]
+
+        for alert in fired:
+            del self.alerts[alert.id]
+
+        # alerts without a reference price are placed against this one
+        if self.pending:
+            pending, self.pending = self.pending, []
+            for alert in pending:
+                self._place(alert, price)
+
+        return fired
+
+    def _place(self, alert, price):
+        if price is None or alert.level == price:
+            alert.direction = None
+            self.pending.append(alert)
+        elif alert.level > price:
+            alert.direction = 'up'
+            i = bisect.bisect_right(self.up_levels, alert.level)
+            self.up_levels.insert(i, alert.level)
+            self.up_alerts.insert(i, alert)
+        else:
+            alert.direction = 'down'
+            i = bisect.bisect_right(self.down_levels, alert.level)
+            self.down_levels.insert(i, alert.level)
+            self.down_alerts.insert(i, alert)
@@ -0,0 +1,209 @@
+# libraries
+import argparse
+import csv
+import itertools
+import json
+import os
+
+import numpy as np
+
+import tick_store
+from batch_pricer import price_scenarios
+from exit_logic import check_exit, exit_action, exit_side, MARKET_EXIT, CANCEL_STOP_LOSS, TAKE_PROFIT, STOP_LOSS
+
+# ticks scanned per vectorized step while looking for the exit of a position
+CHUNK = 1 << 14
+
+
+# read a recorded ticker stream, returns (time in ms, price) arrays
+def load_ticks(path):
+
+    # tick store partition directory, e.g. ticks/kucoin/BTC-USDT
+    if os.path.isdir(path):
+        views = tick_store.read_range(path)
+        if not views:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate([v['exchange_ns'] // 1_000_000 for v in views]), np.concatenate([v['price'] for v in views])
+
+    if path.endswith('.csv'):
+        data = np.loadtxt(path, delimiter=',', skiprows=1, usecols=(0, 1), ndmin=2)
+        return data[:, 0].astype(np.int64), data[:, 1].astype(float)
+
+    # JSON lines, either full websocket messages or their data field
+    times, prices = [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            msg = json.loads(line)
+            data = msg.get('data', msg)
+            if 'price' not in data:
+                continue
+            times.append(int(data['time']))
+            prices.append(float(data['price']))
+    return np.asarray(times, dtype=np.int64), np.asarray(prices, dtype=float)
+
+
+# read entry signals, CSV with time (ms), side and stop loss columns
+def load_signals(path):
+    with open(path) as f:
+        return [(int(row['time']), row['side'], float(row['stop_loss'])) for row in csv.DictReader(f)]
+
+
+# Simulated exchange, market orders fill at the tick price and stop orders trigger on the tick that crosses them
+class SimExchange:
+
+    def __init__(self, fee=0.001):
+        self.fee = fee
+        self.fills = []
+        self.stops = {}
+        self._ids = itertools.count(1)
+
+    def market(self, side, size, price, time, tag=None):
+        fill = {'id': next(self._ids), 'time': time, 'side': side, 'size': size, 'price': price, 'fee': size * price * self.fee, 'tag': tag}
+        self.fills.append(fill)
+        return fill
+
+    # stop='loss' triggers when price falls to stopPrice, stop='entry' when it rises to it, as on KuCoin
+    def stop_order(self, side, size, stopPrice, stop, tag=None):
+        order_id = next(self._ids)
+        self.stops[order_id] = (side, size, stopPrice, stop, tag)
+        return order_id
+
+    def cancel(self, order_id):
+        return self.stops.pop(order_id, None) is not None
+
+    def on_price(self, price, time):
+        fills = []
+        for order_id, (side, size, stopPrice, stop, tag) in list(self.stops.items()):
+            if (stop == 'loss' and price <= stopPrice) or (stop == 'entry' and price >= stopPrice):
+                del self.stops[order_id]
+                fills.append(self.market(side, size, price, time, tag))
+        return fills
+
+
+# Offline replay of the kucoin_bot entry and exit logic
+class Backtester:
+
+    def __init__(self, times, prices, RR=1.5, Risk=1, f=0.001, tp_type='ideal', balance=float('inf')):
+        """
+        balance is the quote balance before each trade, it decides the leveraged branch of a long entry
+        exactly as kucoin_bot.buy does: funds above the balance go through the auto-borrow market order
+        and are closed by the monitor, otherwise exchange stop orders protect the position.
+        """
+        self.times = times
+        self.prices = prices
+        self.RR = RR
+        self.Risk = Risk
+        self.f = f
+        self.tp_type = tp_type
+        self.balance = balance
+        self.exchange = SimExchange(fee=f)
+
+    def _exit_index(self, start, side, TP, SL):
+
+        # vectorized fast-forward to the first tick where check_exit can fire
+        prices = self.prices
+        for lo in range(start, len(prices), CHUNK):
+            chunk = prices[lo:lo + CHUNK]
+            if side == 'buy':
+                crossed = (chunk >= TP) | (chunk <= SL)
+            else:
+                crossed = (chunk <= TP) | (chunk >= SL)
+            if crossed.any():
+                return lo + int(crossed.argmax())
+        return None
+
+    def run_trade(self, time, side, SL):
+
+        start = int(np.searchsorted(self.times, time))
+        if start >= len(self.prices):
+            return None
+
+        # price position size and take profit as the live pricer does
+        P = float(self.prices[start])
+        priced = price_scenarios(side, P, SL, self.RR, self.Risk, self.f, self.tp_type)
+        if not priced['valid']:
+            return None
+        n, V, TP = float(priced['size']), float(priced['funds']), float(priced['takeProfit'])
+
+        # enter, longs are leveraged when the balance does not cover the funds
+        entry_time = int(self.times[start])
+        leveraged = side == 'buy' and self.balance < V * (1 + self.f)
+        entry = self.exchange.market(side, n, P, entry_time, tag='entry')
+        legs = {}
+        if not leveraged:
+            stops = ('loss', 'entry') if side == 'buy' else ('entry', 'loss')
+            legs[STOP_LOSS] = self.exchange.stop_order(exit_side(side), n, SL, stops[0], tag=STOP_LOSS)
+            legs[TAKE_PROFIT] = self.exchange.stop_order(exit_side(side), n, TP, stops[1], tag=TAKE_PROFIT)
+
+        trade = {'time': entry_time, 'side': side, 'leveraged': leveraged, 'size': n, 'entry': P, 'stopLoss': SL, 'takeProfit': TP,
+                 'outcome': None, 'exit': None, 'exitTime': None, 'timeInTrade': None, 'pnl': None, 'fills': [entry]}
+
+        # the first crossing tick runs through the same decision logic as the live monitor
+        i = self._exit_index(start + 1, side, TP, SL)
+        if i is None:
+            for order_id in legs.values():
+                self.exchange.cancel(order_id)
+            return trade
+
+        price, t = float(self.prices[i]), int(self.times[i])
+        hit = check_exit(side, price, TP, SL)
+        action = exit_action(hit, leveraged)
+        if action == MARKET_EXIT:
+            fills = [self.exchange.market(exit_side(side), n, price, t, tag=hit)]
+        else:
+            fills = self.exchange.on_price(price, t)
+            self.exchange.cancel(legs[STOP_LOSS if action == CANCEL_STOP_LOSS else TAKE_PROFIT])
+
+        exit_price = sum(fill['price'] * fill['size'] for fill in fills) / sum(fill['size'] for fill in fills)
+        d = 1 if side == 'buy' else -1
+        trade.update({
+            'outcome': hit,
+            'exit': exit_price,
+            'exitTime': t,
+            'timeInTrade': (t - entry_time) / 1000,
+            'pnl': d * n * (exit_price - P) - sum(fill['fee'] for fill in [entry] + fills),
+            'fills': [entry] + fills
+        })
+        return trade
+
+    def run(self, signals):
+        trades = [self.run_trade(*signal) for signal in signals]
+        return [trade for trade in trades if trade is not None]
+
+
+def summary(trades):
+    closed = [trade for trade in trades if trade['outcome'] is not None]
+    return {
+        'trades': len(trades),
+        'open': len(trades) - len(closed),
+        'takeProfits': sum(trade['outcome'] == TAKE_PROFIT for trade in closed),
+        'stopLosses': sum(trade['outcome'] == STOP_LOSS for trade in closed),
+        'pnl': sum(trade['pnl'] for trade in closed),
+        'avgTimeInTrade': sum(trade['timeInTrade'] for trade in closed) / len(closed) if closed else None,
+        'maxTimeInTrade': max((trade['timeInTrade'] for trade in closed), default=None)
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Replay recorded ticks through the kucoin_bot exit logic")
+    parser.add_argument('ticks', help="recorded ticker stream, tick store directory, .jsonl or .csv (time,price)")
+    parser.add_argument('signals', help="entry signals, .csv with time,side,stop_loss")
+    parser.add_argument('--rr', type=float, default=1.5)
+    parser.add_argument('--risk', type=float, default=1)
+    parser.add_argument('--fee', type=float, default=0.001)
+    parser.add_argument('--tp-type', default='ideal')
+    parser.add_argument('--balance', type=float, default=float('inf'))
+    parser.add_argument('--trades', action='store_true', help="print every trade")
+    args = parser.parse_args()
+
+    times, prices = load_ticks(args.ticks)
+    backtester = Backtester(times, prices, args.rr, args.risk, args.fee, args.tp_type, args.balance)
+    trades = backtester.run(load_signals(args.signals))
+
+    if args.trades:
+        for trade in trades:
+            print({k: v for k, v in trade.items() if k != 'fills'})
+    print(summary(trades))
@@ -0,0 +1,58 @@
+# libraries
+import numpy as np
+
+# take profit modes of both bots, rr_type in binance_bot and tp_type in KucoinAPI
+BEFORE_FEES = ('ideal', 'before_fees')
+AFTER_FEES = ('real', 'after_fees')
+
+
+def price_scenarios(side, price, stopLoss, RR=1.5, Risk=1, f=0.001, tp_type='ideal'):
+    """
+    Vectorized version of the scalar pricers. Every argument is a scalar or an array and all of them
+    are broadcast together, side and tp_type may also be arrays of strings. Returns a dict of arrays
+    with size n, funds V and takeProfit TP for every scenario. Scenarios whose stop loss is on the
+    wrong side of the price are flagged in 'valid' and carry NaN.
+    """
+    P, SL, RR, Risk, f = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (price, stopLoss, RR, Risk, f)))
+    side = np.asarray(side)
+    tp_type = np.asarray(tp_type)
+
+    if not np.isin(side, ('buy', 'sell')).all():
+        raise ValueError("side must be 'buy' or 'sell'")
+    if not np.isin(tp_type, BEFORE_FEES + AFTER_FEES).all():
+        raise ValueError(f"tp_type must be one of {BEFORE_FEES + AFTER_FEES}")
+
+    # determine direction
+    d = np.where(side == 'buy', 1.0, -1.0)
+    valid = np.where(d > 0, SL <= P, SL >= P)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # compute n
+        n = Risk / (SL*(f-d) + P*(f + d))
+
+        # compute position size in quote terms
+        V = n*P
+
+        # compute take profit
+        TP = np.where(
+            np.isin(tp_type, BEFORE_FEES),
+            P + RR*(P-SL),
+            (Risk * RR + n*P*(f+d))/(n*(d-f))
+        )
+
+    return {
+        'price': np.broadcast_to(P, valid.shape),
+        'valid': valid,
+        'takeProfit': np.where(valid, TP, np.nan),
+        'size': np.where(valid, n, np.nan),
+        'funds': np.where(valid, V, np.nan)
+    }
+
+
+def scenario_grid(side, price, stopLoss, RR=1.5, Risk=1, f=0.001, tp_type='ideal'):
+    """
+    Outer product of the parameter vectors: the result arrays have shape
+    (len(stopLoss), len(RR), len(Risk), len(f)), one entry per combination.
+    """
+    SL, RR, Risk, f = np.ix_(*(np.atleast_1d(np.asarray(x, dtype=float)) for x in (stopLoss, RR, Risk, f)))
+    return price_scenarios(side, price, SL, RR, Risk, f, tp_type)
@@ -0,0 +1,104 @@
+# Cold-start benchmark of both bots against an in-process exchange_sim, run from the repo root:
+#   python benchmarks/bench_startup.py --latency 0.05
+#
+# ready is the time from a fresh import until a trade could be priced and protected:
+# streams connected with a first tick, account snapshot and symbol rules loaded.
+import argparse
+import asyncio
+import importlib
+import os
+import socket
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aiohttp import web
+from exchange_sim import PricePath, Simulator
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def report(name, seconds):
+    print(f"{name:<28} {seconds * 1e3:>10.1f} ms")
+
+
+async def start_simulator(latency, port):
+    sim = Simulator(PricePath.random_walk(seed=1), tick_interval=0.01, latency=latency, seed=1)
+    runner = web.AppRunner(sim.app())
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+async def wait_for(condition, timeout=10):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("bot did not become ready")
+        await asyncio.sleep(0.001)
+
+
+async def bench_kucoin():
+    start = time.perf_counter()
+    bot = importlib.import_module('kucoin_bot')
+    report("kucoin import", time.perf_counter() - start)
+
+    # the same four requests one after another, as the import-time bullets plus a serial startup did
+    sequential = time.perf_counter()
+    await bot.kucoin_api.live_stream_id()
+    await bot.kucoin_api.live_stream_id(private=True)
+    await bot.kucoin_api.get_account_info(symbol=bot.SYMBOL)
+    await bot.kucoin_api.get_symbols()
+    report("kucoin sequential requests", time.perf_counter() - sequential)
+    await bot.kucoin_api.close()
+
+    start = time.perf_counter()
+    await bot.startup(SimpleNamespace(bot=None))
+    report("kucoin startup", time.perf_counter() - start)
+    await wait_for(lambda: bot.price_cache.price() is not None and bot.account.loaded and bot.SYMBOL in bot.symbols)
+    report("kucoin ready", time.perf_counter() - start)
+    await bot.shutdown(None)
+
+
+async def bench_binance():
+    start = time.perf_counter()
+    bot = importlib.import_module('binance_bot')
+    report("binance import", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await bot.startup(SimpleNamespace(bot=None))
+    await wait_for(lambda: bot.SYMBOL in bot.symbols)
+    report("binance ready", time.perf_counter() - start)
+    await bot.shutdown(None)
+
+
+async def main(args):
+    port = free_port()
+    runner = await start_simulator(args.latency, port)
+
+    # dummy credentials, every exchange URL points at the simulator
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '1:bench', 'BINANCE_BOT_TOKEN': '1:bench', 'AUTHORIZED_USER_ID': '1', 'TICK_STORE_DIR': '',
+        'KUCOIN_API_KEY': 'key', 'KUCOIN_API_SECRET': 'secret', 'KUCOIN_API_PASSPHRASE': 'passphrase',
+        'BINANCE_API_KEY': 'key', 'BINANCE_API_SECRET': 'secret',
+        'KUCOIN_BASE_URL': f'http://127.0.0.1:{port}', 'BINANCE_BASE_URL': f'http://127.0.0.1:{port}', 'BINANCE_WS_URL': f'ws://127.0.0.1:{port}'
+    })
+
+    print(f"simulated REST latency {args.latency * 1e3:.0f} ms")
+    try:
+        await bench_kucoin()
+        await bench_binance()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Bot cold-start benchmark")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds added to every simulated REST response")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,147 @@
+# libraries
+import hashlib
+import hmac
+import time
+from urllib.parse import urlencode
+
+import aiohttp
+from binance.error import ClientError, ServerError
+
+from rate_limit import RateLimiter, endpoint_limit, CRITICAL, NORMAL, LOW
+
+# (method, path prefix, limit, weight, priority) per endpoint, request weights of the Binance docs
+BINANCE_LIMITS = [
+    ('POST', '/sapi/v1/margin/order/oco', 'sapi', 6, CRITICAL),
+    ('POST', '/sapi/v1/margin/order', 'sapi', 6, CRITICAL),
+    ('DELETE', '/sapi/v1/margin/openOrders', 'sapi', 1, CRITICAL),
+    ('GET', '/sapi/v1/margin/openOrderList', 'sapi', 10, NORMAL),
+    ('GET', '/sapi/v1/margin/isolated/account', 'sapi', 10, LOW),
+    (None, '/sapi/v1/userDataStream', 'sapi', 1, NORMAL),
+    ('GET', '/api/v3/ticker/price', 'api', 2, NORMAL),
+    ('GET', '/api/v3/depth', 'api', 50, LOW),
+    ('GET', '/api/v3/exchangeInfo', 'api', 20, LOW),
+]
+
+# used weight headers of each limit
+USED_WEIGHT_HEADERS = {'api': 'X-MBX-USED-WEIGHT-1M', 'sapi': 'X-SAPI-USED-IP-WEIGHT-1M'}
+
+
+# Signed Binance spot/margin REST client on one pooled aiohttp session
+class AsyncBinanceAPI:
+
+    def __init__(self, api_key: str, api_secret: str, base_url: str = "https://api.binance.com", pool_size: int = 10, timeout: float = 10, recv_window: int = 5000):
+        """
+        Method names and arguments follow binance-connector's Spot client so call sites read the same,
+        errors are raised as binance.error.ClientError / ServerError like the synchronous client.
+        """
+        self.api_key = api_key or ""
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.recv_window = recv_window
+        self.session = None
+
+        # keyed HMAC state and static headers, copied per request instead of rebuilt
+        self._hmac = hmac.new((api_secret or "").encode('utf-8'), digestmod=hashlib.sha256)
+        self._headers = {"X-MBX-APIKEY": self.api_key}
+
+        # request weight per minute, /api and /sapi are counted separately
+        self.limits = {'api': RateLimiter(6000, 60, name="Binance api"), 'sapi': RateLimiter(12000, 60, name="Binance sapi")}
+
+    async def _get_session(self):
+
+        # one pooled keep-alive session, created lazily inside the running loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    def _query(self, params, signed):
+
+        # booleans as Binance spells them, None values dropped
+        params = {k: (str(v).upper() if isinstance(v, bool) else v) for k, v in params.items() if v is not None}
+        if signed:
+            params['recvWindow'] = self.recv_window
+            params['timestamp'] = int(time.time() * 1000)
+        query = urlencode(params, True).replace("%40", "@")
+        if signed:
+            hm = self._hmac.copy()
+            hm.update(query.encode('utf-8'))
+            query += f"&signature={hm.hexdigest()}"
+        return query
+
+    # used weight as the exchange counts it, Retry-After on a 429 or 418 holds the limit
+    def _track(self, limiter, response):
+        for pool, header in USED_WEIGHT_HEADERS.items():
+            used = response.headers.get(header)
+            if used is not None:
+                self.limits[pool].sync(used=int(used))
+        if response.status in (418, 429) and response.headers.get('Retry-After'):
+            limiter.pause(float(response.headers['Retry-After']))
+
+    async def _request(self, method, endpoint, params=None, signed=False, api_key=True):
+
+        # wait for the limit before signing, a queued request must not outlive its recvWindow
+        pool, weight, priority = endpoint_limit(BINANCE_LIMITS, method, endpoint, ('sapi' if endpoint.startswith('/sapi') else 'api', 1, NORMAL))
+        limiter = self.limits[pool]
+        await limiter.acquire(weight, priority)
+
+        query = self._query(params or {}, signed)
+        url = f"{self.base_url}{endpoint}?{query}" if query else f"{self.base_url}{endpoint}"
+        session = await self._get_session()
+
+        async with session.request(method, url, headers=self._headers if api_key else None) as response:
+            self._track(limiter, response)
+            if response.status >= 500:
+                raise ServerError(response.status, await response.text())
+            if response.status >= 400:
+                try:
+                    err = await response.json(content_type=None)
+                except ValueError:
+                    raise ClientError(response.status, None, await response.text(), response.headers)
+                raise ClientError(response.status, err.get('code'), err.get('msg'), response.headers, err.get('data'))
+            return await response.json(content_type=None)
+
+    # ============ Market ============
+
+    async def ticker_price(self, symbol: str = None):
+        return await self._request('GET', '/api/v3/ticker/price', {'symbol': symbol}, api_key=False)
+
+    async def depth(self, symbol: str, limit: int = 1000):
+        return await self._request('GET', '/api/v3/depth', {'symbol': symbol, 'limit': limit}, api_key=False)
+
+    async def exchange_info(self, symbol: str = None, permissions: str = None):
+        return await self._request('GET', '/api/v3/exchangeInfo', {'symbol': symbol, 'permissions': permissions}, api_key=False)
+
+    # ============ Isolated margin ============
+
+    async def isolated_margin_account(self, **kwargs):
+        return await self._request('GET', '/sapi/v1/margin/isolated/account', kwargs, signed=True)
+
+    async def new_margin_order(self, symbol: str, side: str, type: str, **kwargs):
+        return await self._request('POST', '/sapi/v1/margin/order', {'symbol': symbol, 'side': side, 'type': type, **kwargs}, signed=True)
+
+    async def new_margin_oco_order(self, symbol: str, side: str, quantity, price, stopPrice, **kwargs):
+        params = {'symbol': symbol, 'side': side, 'quantity': quantity, 'price': price, 'stopPrice': stopPrice, **kwargs}
+        return await self._request('POST', '/sapi/v1/margin/order/oco', params, signed=True)
+
+    async def get_margin_open_oco_orders(self, **kwargs):
+        return await self._request('GET', '/sapi/v1/margin/openOrderList', kwargs, signed=True)
+
+    async def margin_open_orders_cancellation(self, symbol: str, **kwargs):
+        return await self._request('DELETE', '/sapi/v1/margin/openOrders', {'symbol': symbol, **kwargs}, signed=True)
+
+    # ============ User-data stream ============
+
+    async def new_isolated_margin_listen_key(self, symbol: str):
+        return await self._request('POST', '/sapi/v1/userDataStream/isolated', {'symbol': symbol})
+
+    async def renew_isolated_margin_listen_key(self, symbol: str, listenKey: str):
+        return await self._request('PUT', '/sapi/v1/userDataStream/isolated', {'symbol': symbol, 'listenKey': listenKey})
+
+    async def close_isolated_margin_listen_key(self, symbol: str, listenKey: str):
+        return await self._request('DELETE', '/sapi/v1/userDataStream/isolated', {'symbol': symbol, 'listenKey': listenKey})
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
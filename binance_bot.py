@@ -1,12 +1,19 @@
 # ============ Imports ============
-import os, json, time, threading, asyncio, logging, requests, websocket
+import os, json, uuid, asyncio, logging, aiohttp, websockets
 from dotenv import load_dotenv
 from collections import defaultdict
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
-from binance.spot import Spot as Client
 from binance.lib.utils import config_logging
-from binance.error import ClientError
+from binance.error import ClientError, ServerError
+from tick_store import TickWriter
+from latency import LatencyStats
+from binance_streams import UserDataStreams
+from binance_api import AsyncBinanceAPI
+from symbols import SymbolRegistry, parse_binance
+from order_book import OrderBook, binance_snapshot, binance_diff, risk_size
+from retry import retry
+from notifier import Notifier
 import math
 
 # ============ Load Environment Variables ============
@@ -15,116 +22,194 @@ BOT_TOKEN = os.getenv("BINANCE_BOT_TOKEN")
 AUTHORIZED_USER_ID = int(os.getenv("AUTHORIZED_USER_ID"))
 BINANCE_API_KEY = os.getenv("BINANCE_API_KEY")
 BINANCE_API_SECRET = os.getenv("BINANCE_API_SECRET")
+BINANCE_BASE_URL = os.getenv("BINANCE_BASE_URL", "https://api.binance.com") # e.g. a local exchange_sim.py
+BINANCE_WS_URL = os.getenv("BINANCE_WS_URL", "wss://stream.binance.com:9443")
+SYMBOL = os.getenv("BINANCE_SYMBOL", "BTCUSDT") # default pair, commands take another as their last argument
 
 # ============ Global Variables ============
-MAIN_LOOP = asyncio.get_event_loop()
 config_logging(logging, logging.INFO)
-client = Client(BINANCE_API_KEY, BINANCE_API_SECRET)
-user_data = defaultdict(lambda: {"rr": 1.5, "risk": 1, "fee": 0.001, "rr_type": "before_fees"})
-active_streams = {}
+client = AsyncBinanceAPI(BINANCE_API_KEY, BINANCE_API_SECRET, base_url=BINANCE_BASE_URL)
+user_data = defaultdict(lambda: {"rr": 1.5, "risk": 1, "fee": 0.001, "rr_type": "before_fees", "fill_timeout": 4})
+user_streams = UserDataStreams(client, BINANCE_WS_URL)
+symbols = SymbolRegistry(client.exchange_info, parse_binance)
+latency_stats = LatencyStats()
+order_book = OrderBook(SYMBOL, client.depth, binance_snapshot, binance_diff)
+depth_task = None
+tick_task = None
+notifier = Notifier() # Telegram replies are queued, never awaited by trading code
 
 # ============ Informative Commands ============
 
 async def config(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        return await update.message.reply_text("Unauthorized user.")
+        return notifier.reply(update, "Unauthorized user.")
     user_config = user_data[update.effective_user.id]
     config_text = "\n".join([f"{k} = {v}" for k, v in user_config.items()])
-    await update.message.reply_text(f"Your configuration:\n{config_text}")
+    notifier.reply(update, f"Your configuration:\n{config_text}")
 
 async def set_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        return await update.message.reply_text("Unauthorized user.")
+        return notifier.reply(update, "Unauthorized user.")
     if len(context.args) != 2:
-        return await update.message.reply_text("Usage: /write <variable> <value>")
+        return notifier.reply(update, "Usage: /write <variable> <value>")
     user_data[update.effective_user.id][context.args[0]] = float(context.args[1])
-    await update.message.reply_text(f"Set {context.args[0]} = {context.args[1]}")
+    notifier.reply(update, f"Set {context.args[0]} = {context.args[1]}")
 
 async def get_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        return await update.message.reply_text("Unauthorized user.")
+        return notifier.reply(update, "Unauthorized user.")
     if len(context.args) != 1:
-        return await update.message.reply_text("Usage: /read <variable>")
+        return notifier.reply(update, "Usage: /read <variable>")
     value = user_data[update.effective_user.id].get(context.args[0], "Not set")
-    await update.message.reply_text(f"{context.args[0]} = {value}")
+    notifier.reply(update, f"{context.args[0]} = {value}")
 
 async def get_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        return await update.message.reply_text("Unauthorized user.")
-    account_info = client.isolated_margin_account(symbols="BTCUSDT")
+        return notifier.reply(update, "Unauthorized user.")
+    info = symbol_arg(context.args, 0)
+    if info is None:
+        return notifier.reply(update, "Unknown symbol")
+    account_info = await client.isolated_margin_account(symbols=info.symbol)
     btc_balance = account_info['assets'][0]['baseAsset']['netAsset']
     cash_balance = account_info['assets'][0]['quoteAsset']['netAsset']
-    await update.message.reply_text(f"BTC  balance: {btc_balance}\nCash balance: {cash_balance}")
+    notifier.reply(update, f"{info.base}  balance: {btc_balance}\nCash balance: {cash_balance}")
 
 async def menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        return await update.message.reply_text("Unauthorized user.")
-    await update.message.reply_text("balance\nclose\nkill\nsell [stop loss]\nbuy [stop loss]\nread [variable]\nwrite [variable] [new value]\nconfig")
+        return notifier.reply(update, "Unauthorized user.")
+    notifier.reply(update, "balance [symbol]\nclose [symbol]\nkill\nsell [stop loss] [symbol]\nbuy [stop loss] [symbol]\nread [variable]\nwrite [variable] [new value]\nconfig\nstats")
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != AUTHORIZED_USER_ID:
+        return notifier.reply(update, "Unauthorized user.")
+    notifier.reply(update, latency_stats.report())
 
 # ============ Trade Calculation ============
 
-def pricer(side, SL, RR, Risk, f, rr_type):
+# trading rules of the symbol given at args[i], the default pair when it is omitted
+def symbol_arg(args, i):
+    return symbols.get(args[i].upper() if len(args) > i else SYMBOL)
+
+async def pricer(side, SL, RR, Risk, f, rr_type, info):
     try:
-        P = float(client.ticker_price("BTCUSDT")['price'])
+        # price and account are independent, fetch both at once
+        ticker, account_info = await asyncio.gather(client.ticker_price(info.symbol), client.isolated_margin_account(symbols=info.symbol))
+        P = float(ticker['price'])
         d = 1 if side == "buy" else -1
         if (side == 'buy' and SL > P) or (side == 'sell' and SL < P): return None
-        info = client.isolated_margin_account(symbols="BTCUSDT")['assets'][0]
-        n = Risk / (SL*(f-d) + P*(f+d))
-        V = n * P
-        TP = P + RR*(P - SL) if rr_type == 'before_fees' else (Risk * RR + n*P*(f+d)) / (n*(d-f))
-        return {"price": P, "cryptoBalanceBefore": info['baseAsset']['netAsset'], "cashBalanceBefore": info['quoteAsset']['netAsset'], "takeProfit": f"{TP:.0f}", "size": f"{n:.5f}", "funds": f"{V:.2f}"}
-    except:
+        assets = account_info['assets'][0]
+        # entry at the expected fill of the local book when it follows this symbol
+        sized = risk_size(side, SL, P, Risk, f, order_book if info.symbol == order_book.symbol else None)
+        if sized is None: return None
+        n, E, worst = sized
+        V = n * E
+        TP = E + RR*(E - SL) if rr_type == 'before_fees' else (Risk * RR + n*E*(f+d)) / (n*(d-f))
+        if not info.tradable(n, E): return None
+        return {"price": P, "vwap": E, "worstPrice": worst, "cryptoBalanceBefore": assets['baseAsset']['netAsset'], "cashBalanceBefore": assets['quoteAsset']['netAsset'], "takeProfit": info.format_price(TP), "size": info.format_size(n), "funds": info.format_funds(V)}
+    # exchange and response-shape errors only, cancellation must reach the caller
+    except (ClientError, ServerError, aiohttp.ClientError, asyncio.TimeoutError, KeyError, IndexError, ValueError, ZeroDivisionError) as e:
+        logging.error(f"Binance pricer failed: {e}")
         return None
 
 # ============ Buy/Sell Commands ============
 
 async def trade(update: Update, context: ContextTypes.DEFAULT_TYPE, side):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        return await update.message.reply_text("Unauthorized user.")
+        return notifier.reply(update, "Unauthorized user.")
+    trace = latency_stats.trace(side, update.message.date)
     SL = float(context.args[0])
+    info = symbol_arg(context.args, 1)
+    if info is None:
+        return notifier.reply(update, "Unknown symbol")
     config = user_data[update.effective_user.id]
-    result = pricer(side, SL, config['rr'], config['risk'], config['fee'], config['rr_type'])
+    result = await pricer(side, SL, config['rr'], config['risk'], config['fee'], config['rr_type'], info)
+    trace.mark('pricer')
     if not result:
-        return await update.message.reply_text("Pricer empty, didn't execute")
+        return notifier.reply(update, "Pricer empty, didn't execute")
+
+    symbol = info.symbol
+    loop = asyncio.get_running_loop()
+    uid = uuid.uuid4().hex[:24]
+    entry_id, tp_id, sl_id = f"entry_{uid}", f"tp_{uid}", f"sl_{uid}"
+    entry_filled = loop.create_future()
+
+    def resolve(fut, value):
+        if not fut.done(): fut.set_result(value)
+
+    # the shared user-data stream is open before the entry so its fill event cannot be missed
+    stream = user_streams.acquire(symbol)
 
+    # handlers run on this event loop, anything awaited goes to a task
+    def on_entry(d):
+        if d['X'] == 'FILLED':
+            resolve(entry_filled, d)
+
+    def on_exit(d):
+        if d['X'] != 'FILLED':
+            return
+        stream.off(entry_id, tp_id, sl_id)
+        asyncio.create_task(notify_exit(d))
+
+    async def notify_exit(d):
+        await user_streams.release(symbol)
+        price = round(max([float(d['p']), float(d['P']), float(d['L'])]), 0)
+        order_type = 'Take Profit' if d['o'] == 'LIMIT_MAKER' else 'Stop Loss'
+        account_info = await client.isolated_margin_account(symbols=symbol)
+        btc_balance = account_info['assets'][0]['baseAsset']['netAsset']
+        cash_balance = account_info['assets'][0]['quoteAsset']['netAsset']
+        exposure = float(btc_balance) * price
+        notifier.reply(update, f"{order_type} hit at {price}\nnew crypto balance: {btc_balance}\nnew cash balance: {cash_balance}\nStill USDT {exposure} of exposure\nPlease 'close all' at earliest convenience.")
+
+    stream.on(entry_id, on_entry)
+    stream.on(tp_id, on_exit)
+    stream.on(sl_id, on_exit)
+
+    # the timeout is only a fallback, the OCO goes out as soon as the entry is confirmed filled
+    timeout = config.get('fill_timeout', 4)
     try:
-        order = client.new_margin_order(symbol="BTCUSDT", side=side.upper(), type="MARKET", quantity=result['size'], sideEffectType="AUTO_BORROW_REPAY", isIsolated=True)
-        time.sleep(4)
-        oco = client.new_margin_oco_order(symbol="BTCUSDT", side="SELL" if side=="buy" else "BUY", quantity=order['executedQty'], price=result['takeProfit'], stopPrice=str(SL), sideEffectType="AUTO_BORROW_REPAY", isIsolated=True)
-        fills = [float(fill['price']) for fill in order['fills']]
-        avg_price = sum(fills) / len(fills)
-        for o in oco['orderReports']:
-            if o['type'] == 'STOP_LOSS': SL_exec = o['stopPrice']
-            else: TP_exec = o['price']
-        dir = 'Sold' if side == 'sell' else 'Bought'
-        await update.message.reply_text(f"BTC before: {result['cryptoBalanceBefore']}\nCash before: {result['cashBalanceBefore']}\n{dir} {order['executedQty']} BTC at {avg_price:.0f}\nSL: {SL_exec} | TP: {TP_exec}")
-    except:
-        return await update.message.reply_text("Binance order error")
-
-    symbol = 'BTCUSDT'
-    lk = requests.post('https://api.binance.com/sapi/v1/userDataStream/isolated', headers={'X-MBX-APIKEY': BINANCE_API_KEY}, params={'symbol': symbol}).json()['listenKey']
-
-    def on_msg(ws, msg):
-        d = json.loads(msg)
-        if d.get('e') == 'executionReport' and d.get('X') == 'FILLED':
-            price = round(max([float(d['p']), float(d['P']), float(d['L'])]), 0)
-            order_type = 'Take Profit' if d['o'] == 'LIMIT_MAKER' else 'Stop Loss'
-            account_info = client.isolated_margin_account(symbols="BTCUSDT")
-            btc_balance = account_info['assets'][0]['baseAsset']['netAsset']
-            cash_balance = account_info['assets'][0]['quoteAsset']['netAsset']
-            exposure = float(btc_balance) * price
-            asyncio.run_coroutine_threadsafe(update.message.reply_text(f"{order_type} hit at {price}\nnew crypto balance: {btc_balance}\nnew cash balance: {cash_balance}\nStill USDT {exposure} of exposure\nPlease 'close all' at earliest convenience."), MAIN_LOOP)
-            ws.close()
-
-    def keep_alive():
-        while True:
-            requests.put('https://api.binance.com/sapi/v1/userDataStream/isolated', headers={'X-MBX-APIKEY': BINANCE_API_KEY}, params={'symbol': symbol, 'listenKey': lk})
-            time.sleep(1800)
+        await asyncio.wait_for(stream.connected.wait(), timeout)
+    except asyncio.TimeoutError:
+        logging.warning("User-data stream not open after %ss, sending entry anyway", timeout)
+    trace.mark('stream_open')
+
+    qty = None
+    try:
+        order = await client.new_margin_order(symbol=symbol, side=side.upper(), type="MARKET", quantity=result['size'], newClientOrderId=entry_id, sideEffectType="AUTO_BORROW_REPAY", isIsolated=True)
+        trace.mark('entry_ack')
+        qty, quote = order['executedQty'], order['cummulativeQuoteQty']
+        if order.get('status') != 'FILLED':
+            try:
+                filled = await asyncio.wait_for(entry_filled, timeout)
+                qty, quote = filled['z'], filled['Z']
+            except asyncio.TimeoutError:
+                logging.warning("No FILLED event for %s after %ss, protecting executed quantity", entry_id, timeout)
+        stream.off(entry_id)
+        trace.mark('fill_confirm')
+        if float(qty) <= 0:
+            # nothing to protect, an OCO for 0 would be rejected anyway
+            stream.off(tp_id, sl_id)
+            await user_streams.release(symbol)
+            return notifier.reply(update, "Entry not filled, no position opened")
+        oco = await client.new_margin_oco_order(symbol=symbol, side="SELL" if side=="buy" else "BUY", quantity=qty, price=result['takeProfit'], stopPrice=info.format_price(SL), limitClientOrderId=tp_id, stopClientOrderId=sl_id, sideEffectType="AUTO_BORROW_REPAY", isIsolated=True)
+    except (ClientError, ServerError, aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+        # the OCO is the last call, nothing is on the book to listen for
+        logging.error(f"Binance order failed: {e}")
+        stream.off(entry_id, tp_id, sl_id)
+        await user_streams.release(symbol)
+        if qty is not None and float(qty) > 0:
+            return notifier.reply(update, f"Binance OCO error, {qty} {info.base} entered without SL/TP")
+        return notifier.reply(update, "Binance order error")
+    trace.mark('oco_ack')
+    trace.finish('protected')
 
-    threading.Thread(target=keep_alive, daemon=True).start()
-    ws_app = websocket.WebSocketApp(f"wss://stream.binance.com:9443/ws/{lk}", on_message=on_msg)
-    active_streams[update.effective_user.id] = ws_app
-    threading.Thread(target=ws_app.run_forever, daemon=True).start()
+    # the OCO is live from here, reporting it must not fail the trade
+    avg_price = float(quote) / float(qty)
+    SL_exec = TP_exec = None
+    for o in oco.get('orderReports', []):
+        if o.get('type') == 'STOP_LOSS': SL_exec = o.get('stopPrice')
+        else: TP_exec = o.get('price')
+    dir = 'Sold' if side == 'sell' else 'Bought'
+    notifier.reply(update, f"{info.base} before: {result['cryptoBalanceBefore']}\nCash before: {result['cashBalanceBefore']}\n{dir} {qty} {info.base} at {avg_price:.0f}\nSL: {SL_exec or info.format_price(SL)} | TP: {TP_exec or result['takeProfit']}")
 
 async def buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await trade(update, context, "buy")
@@ -136,42 +221,111 @@ async def sell(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def kill(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        return await update.message.reply_text("Unauthorized user.")
+        return notifier.reply(update, "Unauthorized user.")
     
-    for uid, ws in list(active_streams.items()):
-        try: ws.close()
-        except: pass
-        active_streams.pop(uid, None)
-    await update.message.reply_text("All Binance streams stopped.")
+    await user_streams.close_all()
+    notifier.reply(update, "All Binance streams stopped.")
 
 async def close(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        return await update.message.reply_text("Unauthorized user.")
+        return notifier.reply(update, "Unauthorized user.")
     
+    info = symbol_arg(context.args, 0)
+    if info is None:
+        return notifier.reply(update, "Unknown symbol")
+    symbol = info.symbol
+
     # cancel open OCO orders
-    open_orders = client.get_margin_open_oco_orders(isIsolated=True, symbol="BTCUSDT")
+    open_orders = await client.get_margin_open_oco_orders(isIsolated=True, symbol=symbol)
     if len(open_orders) != 0:
-        client.margin_open_orders_cancellation("BTCUSDT",isIsolated=True)
-        await update.message.reply_text("Closed open OCO orders")
+        await client.margin_open_orders_cancellation(symbol,isIsolated=True)
+        notifier.reply(update, "Closed open OCO orders")
 
-    time.sleep(2)
+    await asyncio.sleep(2)
 
-    # get outstanding BTC balance
-    account_info = client.isolated_margin_account(symbols="BTCUSDT")
+    # get outstanding base balance
+    account_info = await client.isolated_margin_account(symbols=symbol)
     btc_balance = float(account_info['assets'][0]['baseAsset']['netAsset'])
 
-    # flatten current BTC balance
-    amount_to_close = str(math.floor(abs(btc_balance) * 10**5) / 10**5)
-    if btc_balance < -0.00001:
-        client.new_margin_order(symbol="BTCUSDT", side='BUY', type="MARKET", quantity=amount_to_close, sideEffectType="AUTO_BORROW_REPAY", isIsolated=True)
-        await update.message.reply_text("Closed outstanding BTC balance")
-    elif btc_balance > 0.00001:
-        client.new_margin_order(symbol="BTCUSDT", side='SELL', type="MARKET", quantity=amount_to_close, sideEffectType="AUTO_BORROW_REPAY", isIsolated=True)
-        await update.message.reply_text("Closed outstanding BTC balance")
+    # flatten current base balance, a long's dust below one lot step stays, a short's debt is bought back in full
+    amount_to_close = info.format_size_up(-btc_balance) if btc_balance < 0 else info.format_size(btc_balance)
+    if float(amount_to_close) == 0:
+        return
+    if btc_balance < 0:
+        await client.new_margin_order(symbol=symbol, side='BUY', type="MARKET", quantity=amount_to_close, sideEffectType="AUTO_BORROW_REPAY", isIsolated=True)
+        notifier.reply(update, f"Closed outstanding {info.base} balance")
+    else:
+        await client.new_margin_order(symbol=symbol, side='SELL', type="MARKET", quantity=amount_to_close, sideEffectType="AUTO_BORROW_REPAY", isIsolated=True)
+        notifier.reply(update, f"Closed outstanding {info.base} balance")
+
+# ============ Tick Recording ============
+
+TICK_STORE_DIR = os.getenv("TICK_STORE_DIR", "ticks")
+
+async def record_ticks(symbol=SYMBOL):
+    # trades are recorded with the latest best bid/ask, the page cache writes them back
+    writer = TickWriter(TICK_STORE_DIR, "binance", symbol)
+    bid = ask = math.nan
+    s = symbol.lower()
+
+    try:
+        while True:
+            try:
+                async with websockets.connect(f"{BINANCE_WS_URL}/stream?streams={s}@trade/{s}@bookTicker") as websocket:
+                    async for raw in websocket:
+                        d = json.loads(raw)['data']
+                        if d.get('e') == 'trade':
+                            writer.append(d['T'] * 1_000_000, float(d['p']), float(d['q']), bid, ask)
+                        elif 'b' in d:
+                            bid, ask = float(d['b']), float(d['a'])
+            except (websockets.WebSocketException, OSError) as e:
+                logging.error(f"Binance tick stream closed: {e}")
+            await asyncio.sleep(5)
+    finally:
+        writer.close()
+
+# ============ Order Book ============
+
+# depth diffs into the local book, a reconnect shows up as a sequence gap and resyncs it
+async def stream_depth(book):
+    s = book.symbol.lower()
+    while True:
+        try:
+            async with websockets.connect(f"{BINANCE_WS_URL}/stream?streams={s}@depth@100ms") as websocket:
+                async for raw in websocket:
+                    book.update(json.loads(raw)['data'])
+        except (websockets.WebSocketException, OSError) as e:
+            logging.error(f"Binance depth stream closed: {e}")
+        # diffs are lost while disconnected, the first one after the reconnect resyncs the book
+        book.close()
+        await asyncio.sleep(1)
+
+# load the trading rules and run the tick recorder on the bot's event loop, nothing touches the network at import
+async def startup(application):
+    notifier.start(application.bot)
+    await retry(symbols.start)
+    global depth_task, tick_task
+    if TICK_STORE_DIR:
+        tick_task = asyncio.create_task(record_ticks())
+    depth_task = asyncio.create_task(stream_depth(order_book))
+
+# close the user-data streams, their listenKeys and the pooled connections on shutdown
+async def shutdown(application):
+    symbols.stop()
+    if depth_task is not None:
+        depth_task.cancel()
+    if tick_task is not None:
+        # wait for record_ticks to close the day file, which trims its preallocation
+        tick_task.cancel()
+        await asyncio.gather(tick_task, return_exceptions=True)
+    order_book.close()
+    await user_streams.close_all()
+    await client.close()
+    await notifier.stop()
 
 # ============ Launch Bot ============
 
-app = ApplicationBuilder().token(BOT_TOKEN).build()
+app = ApplicationBuilder().token(BOT_TOKEN).post_init(startup).post_shutdown(shutdown).build()
 app.add_handler(CommandHandler("config", config))
 app.add_handler(CommandHandler("write", set_value))
 app.add_handler(CommandHandler("read", get_value))
@@ -181,6 +335,7 @@ app.add_handler(CommandHandler("kill", kill))
 app.add_handler(CommandHandler('close', close))
 app.add_handler(CommandHandler('balance', get_balance))
 app.add_handler(CommandHandler('menu', menu))
+app.add_handler(CommandHandler('stats', stats))
 
 if __name__ == "__main__":
     app.run_polling()
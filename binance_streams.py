@@ -0,0 +1,152 @@
+# libraries
+import asyncio
+import json
+import logging
+
+import aiohttp
+import websockets
+from binance.error import ClientError, ServerError
+
+
+# One long-lived isolated margin user-data stream, events dispatched to per-order handlers
+class UserDataStream:
+
+    def __init__(self, symbol, api, ws_url="wss://stream.binance.com:9443", renew_interval=1800):
+        """
+        Runs as tasks on the bot's event loop, handlers are called on the loop with the decoded executionReport.
+        api is the AsyncBinanceAPI used for the listenKey calls.
+        """
+        self.symbol = symbol
+        self.api = api
+        self.ws_url = ws_url
+        self.renew_interval = renew_interval
+        self.listen_key = None
+        self.handlers = {} # clientOrderId -> callback(executionReport)
+        self.connected = asyncio.Event()
+        self.websocket = None
+        self._task = None
+        self._renewer = None
+
+    # ============ listenKey ============
+
+    async def _new_listen_key(self):
+        self.listen_key = (await self.api.new_isolated_margin_listen_key(self.symbol))['listenKey']
+
+    async def _renew(self):
+        # a single renewal loop per stream, a failed renewal means the key is gone and the stream reconnects
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            if self.listen_key is None:
+                continue
+            try:
+                await self.api.renew_isolated_margin_listen_key(self.symbol, self.listen_key)
+            except ClientError:
+                self._expire()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ServerError) as e:
+                logging.error(f"listenKey renewal failed: {e}")
+
+    def _expire(self):
+        logging.warning(f"listenKey for {self.symbol} expired, reconnecting")
+        self.listen_key = None
+        if self.websocket is not None:
+            asyncio.create_task(self.websocket.close())
+
+    # ============ Websocket ============
+
+    def _dispatch(self, d):
+        event = d.get('e')
+        if event == 'listenKeyExpired':
+            return self._expire()
+        if event != 'executionReport':
+            return
+
+        # cancellations carry the original client order id in 'C'
+        handler = self.handlers.get(d.get('c')) or self.handlers.get(d.get('C'))
+        if handler is not None:
+            try:
+                handler(d)
+            except Exception:
+                logging.exception(f"executionReport handler failed for {d.get('c')}")
+
+    async def _run(self):
+        backoff = 1
+        while True:
+            try:
+                if self.listen_key is None:
+                    await self._new_listen_key()
+                async with websockets.connect(f"{self.ws_url}/ws/{self.listen_key}") as websocket:
+                    self.websocket = websocket
+                    self.connected.set()
+                    backoff = 1
+                    async for raw in websocket:
+                        self._dispatch(json.loads(raw))
+            except (websockets.WebSocketException, OSError, aiohttp.ClientError, asyncio.TimeoutError, ClientError, ServerError, KeyError) as e:
+                logging.error(f"User-data stream for {self.symbol} failed: {e}")
+                backoff = min(backoff * 2, 60)
+            finally:
+                self.websocket = None
+                self.connected.clear()
+            await asyncio.sleep(backoff)
+
+    # ============ Lifecycle ============
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        self._renewer = asyncio.create_task(self._renew())
+
+    async def stop(self):
+        for task in (self._task, self._renewer):
+            if task is not None:
+                task.cancel()
+        self.handlers.clear()
+        if self.listen_key is not None:
+            try:
+                await self.api.close_isolated_margin_listen_key(self.symbol, self.listen_key)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ClientError, ServerError):
+                pass
+            self.listen_key = None
+
+    def on(self, client_order_id, handler):
+        self.handlers[client_order_id] = handler
+
+    def off(self, *client_order_ids):
+        for client_order_id in client_order_ids:
+            self.handlers.pop(client_order_id, None)
+
+
+# Refcounted user-data streams, one per symbol for however many open trades use it
+class UserDataStreams:
+
+    def __init__(self, api, ws_url="wss://stream.binance.com:9443", renew_interval=1800):
+
+        self.api = api
+        self.ws_url = ws_url
+        self.renew_interval = renew_interval
+        self.streams = {}
+        self.refs = {}
+
+    # everything runs on one event loop, so the bookkeeping needs no lock
+    def acquire(self, symbol):
+        stream = self.streams.get(symbol)
+        if stream is None:
+            stream = UserDataStream(symbol, self.api, self.ws_url, self.renew_interval)
+            stream.start()
+            self.streams[symbol] = stream
+            self.refs[symbol] = 0
+        self.refs[symbol] += 1
+        return stream
+
+    async def release(self, symbol):
+        if symbol not in self.refs:
+            return
+        self.refs[symbol] -= 1
+        if self.refs[symbol] <= 0:
+            del self.refs[symbol]
+            await self.streams.pop(symbol).stop()
+
+    async def close_all(self):
+        streams = list(self.streams.values())
+        self.streams.clear()
+        self.refs.clear()
+        await asyncio.gather(*(stream.stop() for stream in streams))
+        return len(streams)
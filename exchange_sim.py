@@ -0,0 +1,654 @@
+# Local KuCoin/Binance stand-in for load and latency testing.
+#
+#   python exchange_sim.py --port 8080 --prices ticks/kucoin/BTC-USDT --tick-interval 0.01 --latency 0.005 --error-rate 0.01
+#
+# then point the bots at it:
+#   KUCOIN_BASE_URL=http://127.0.0.1:8080 python kucoin_bot.py
+#   BINANCE_BASE_URL=http://127.0.0.1:8080 BINANCE_WS_URL=ws://127.0.0.1:8080 python binance_bot.py
+
+# libraries
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+import uuid
+from collections import Counter
+
+import numpy as np
+from aiohttp import web, WSMsgType
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def kucoin_ok(data):
+    return web.json_response({"code": "200000", "data": data})
+
+
+def kucoin_error(status, code, msg):
+    return web.json_response({"code": code, "msg": msg}, status=status)
+
+
+def binance_error(status, code, msg):
+    return web.json_response({"code": code, "msg": msg}, status=status)
+
+
+# Scripted price path, replayed in a loop
+class PricePath:
+
+    def __init__(self, prices):
+        self.prices = np.asarray(prices, dtype=float)
+        self.i = 0
+
+    @classmethod
+    def random_walk(cls, start=60000.0, steps=100_000, volatility=2.0, seed=None):
+        rng = np.random.default_rng(seed)
+        return cls(start + np.cumsum(rng.normal(0, volatility, steps)))
+
+    @classmethod
+    def load(cls, path):
+        # any recording backtest.py can read: tick store directory, .csv or .jsonl
+        from backtest import load_ticks
+        return cls(load_ticks(path)[1])
+
+    def next(self):
+        price = float(self.prices[self.i])
+        self.i = (self.i + 1) % len(self.prices)
+        return price
+
+
+# One isolated margin pair, negative balances are borrowed
+class SimAccount:
+
+    def __init__(self, base, quote, base_balance=0.0, quote_balance=1000.0):
+        self.base = base
+        self.quote = quote
+        self.balances = {base: base_balance, quote: quote_balance}
+
+    def trade(self, side, size, price, fee):
+        d = 1 if side == 'buy' else -1
+        self.balances[self.base] += d * size
+        self.balances[self.quote] -= d * size * price + size * price * fee
+
+    def total(self, currency):
+        return max(self.balances[currency], 0.0)
+
+    def liability(self, currency):
+        return max(-self.balances[currency], 0.0)
+
+
+# Matching engine and state shared by both exchange facades
+class Simulator:
+
+    def __init__(self, path, kucoin_symbol="BTC-USDT", binance_symbol="BTCUSDT", spread=0.1, fee=0.001,
+                 tick_interval=0.01, latency=0.0, jitter=0.0, error_rate=0.0, quote_balance=1000.0, seed=None,
+                 book_depth=50, book_step=0.5):
+
+        self.path = path
+        self.kucoin_symbol = kucoin_symbol
+        self.binance_symbol = binance_symbol
+        self.spread = spread
+        self.fee = fee
+        self.tick_interval = tick_interval
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.book_random = random.Random(seed)
+
+        base, quote = kucoin_symbol.split('-')
+        self.kucoin_account = SimAccount(base, quote, quote_balance=quote_balance)
+        self.binance_account = SimAccount(base, quote, quote_balance=quote_balance)
+
+        self.price = path.next()
+        self.sequence = 0
+        self.ids = itertools.count(1)
+        self.stats = Counter()
+
+        # depth shared by both exchanges, levels every book_step from the touch
+        self.book_depth = book_depth
+        self.book_step = book_step
+        self.book = {'bids': {}, 'asks': {}}
+        self.book_sequence = 0
+        self.book_changes = {'bids': [], 'asks': []}
+        self.move_book()
+
+        # KuCoin state
+        self.kucoin_orders = {}
+        self.kucoin_stops = {}
+        self.kucoin_public = {} # websocket -> subscribed topics
+        self.kucoin_private = {}
+
+        # Binance state
+        self.binance_orders = {}
+        self.binance_oco = {}
+        self.listen_keys = {} # listenKey -> set of websockets
+        self.binance_market = {} # websocket -> subscribed streams
+
+    @property
+    def bid(self):
+        return self.price - self.spread / 2
+
+    @property
+    def ask(self):
+        return self.price + self.spread / 2
+
+    def fill_price(self, side):
+        return self.ask if side == 'buy' else self.bid
+
+    # ============ Middleware ============
+
+    @web.middleware
+    async def inject(self, request, handler):
+        self.stats[f"{request.method} {request.path}"] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+        if self.error_rate and not request.path.startswith('/sim/') and self.random.random() < self.error_rate:
+            self.stats['injected errors'] += 1
+            if request.path.startswith('/sapi') or request.path.startswith('/api/v3/ticker'):
+                return binance_error(429, -1003, "Too many requests; injected by exchange_sim.")
+            return kucoin_error(429, "429000", "Too Many Requests, injected by exchange_sim.")
+        return await handler(request)
+
+    async def sim_stats(self, request):
+        return web.json_response({'price': self.price, 'ticks': self.sequence, 'requests': dict(self.stats)})
+
+    # drop every websocket, to exercise the bots' reconnect paths
+    async def sim_disconnect(self, request):
+        sockets = set(self.kucoin_public) | set(self.binance_market) | {ws for clients in self.listen_keys.values() for ws in clients}
+        for ws in sockets:
+            await ws.close()
+        return web.json_response({'closed': len(sockets)})
+
+    # ============ Price path ============
+
+    async def run_path(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            self.tick(self.path.next())
+
+    def tick(self, price):
+        self.price = price
+        self.sequence += 1
+        self.move_book()
+        self.kucoin_trigger()
+        self.binance_trigger()
+        self.kucoin_push_ticker()
+        self.kucoin_push_level2()
+        self.binance_push_market()
+
+    # ============ Depth ============
+
+    def level_size(self):
+        return round(self.book_random.uniform(0.001, 2.0), 8)
+
+    # levels follow the touch, a few resting sizes change every tick
+    def move_book(self):
+        changes = {'bids': [], 'asks': []}
+        for side, touch, direction in (('bids', self.bid, -1), ('asks', self.ask, 1)):
+            old = self.book[side]
+            new = {}
+            for i in range(self.book_depth):
+                price = round(touch + direction * i * self.book_step, 2)
+                new[price] = old.get(price) or self.level_size()
+            for price in self.book_random.sample(list(new), 3):
+                new[price] = self.level_size()
+            for price in old.keys() | new.keys():
+                size = new.get(price, 0.0)
+                if old.get(price) != size:
+                    self.book_sequence += 1
+                    changes[side].append((price, size, self.book_sequence))
+            self.book[side] = new
+        self.book_changes = changes
+
+    def book_levels(self, side, limit=None):
+        levels = sorted(self.book[side].items(), reverse=side == 'bids')[:limit]
+        return [[f"{price:.2f}", f"{size:.8f}"] for price, size in levels]
+
+    # ============ KuCoin ============
+
+    def kucoin_fill(self, side, size=None, funds=None, client_oid=None):
+        price = self.fill_price(side)
+        if size is None:
+            size = float(funds) / price
+        size = float(size)
+        self.kucoin_account.trade(side, size, price, self.fee)
+        order_id = uuid.uuid4().hex[:24]
+        self.kucoin_orders[order_id] = {
+            "id": order_id, "clientOid": client_oid, "symbol": self.kucoin_symbol, "side": side, "type": "market",
+            "size": f"{size:.8f}", "dealSize": f"{size:.8f}", "dealFunds": f"{size * price:.8f}",
+            "fee": f"{size * price * self.fee:.8f}", "active": False, "createdAt": now_ms()
+        }
+        self.kucoin_push_position()
+        self.kucoin_push_order(self.kucoin_orders[order_id], price)
+        return order_id
+
+    def kucoin_trigger(self):
+        for order_id, stop in list(self.kucoin_stops.items()):
+            if (stop['stop'] == 'loss' and self.price <= stop['stopPrice']) or (stop['stop'] == 'entry' and self.price >= stop['stopPrice']):
+                del self.kucoin_stops[order_id]
+                self.kucoin_push_advanced(order_id, stop, "triggered")
+                self.kucoin_fill(stop['side'], size=stop['size'], client_oid=stop['clientOid'])
+
+    async def kucoin_market_order(self, request):
+        body = await request.json()
+        if body.get('size') is None and body.get('funds') is None:
+            return kucoin_error(400, "400100", "size or funds required")
+        order_id = self.kucoin_fill(body['side'], body.get('size'), body.get('funds'), body.get('clientOid'))
+        return kucoin_ok({"orderId": order_id, "clientOid": body.get('clientOid'), "borrowSize": None, "loanApplyId": None})
+
+    async def kucoin_order_info(self, request):
+        order = self.kucoin_orders.get(request.match_info['order_id'])
+        if order is None:
+            return kucoin_error(404, "400100", "order not exist")
+        return kucoin_ok(order)
+
+    async def kucoin_stop_order(self, request):
+        body = await request.json()
+        order_id = "vs" + uuid.uuid4().hex[:22]
+        self.kucoin_stops[order_id] = {
+            "side": body['side'], "size": float(body['size']), "stopPrice": float(body['stopPrice']),
+            "stop": body.get('stop', 'loss'), "clientOid": body.get('clientOid')
+        }
+        self.kucoin_push_advanced(order_id, self.kucoin_stops[order_id], "open")
+        return kucoin_ok({"orderId": order_id})
+
+    async def kucoin_cancel(self, request):
+        order_id = request.match_info['order_id']
+        stop = self.kucoin_stops.pop(order_id, None)
+        if stop is None and order_id not in self.kucoin_orders:
+            return kucoin_error(404, "400100", "order not exist")
+        if stop is not None:
+            self.kucoin_push_advanced(order_id, stop, "cancel")
+        return kucoin_ok({"cancelledOrderIds": [order_id]})
+
+    async def kucoin_mark_price(self, request):
+        ticker = request.match_info['ticker']
+        value = 1 / self.price if ticker.startswith('USDT') else self.price
+        return kucoin_ok({"symbol": ticker, "granularity": 1000, "timePoint": now_ms(), "value": value})
+
+    async def kucoin_level1(self, request):
+        return kucoin_ok({"sequence": str(self.sequence), "price": str(self.price), "size": "0.001",
+                          "bestBid": str(self.bid), "bestBidSize": "1", "bestAsk": str(self.ask), "bestAskSize": "1", "time": now_ms()})
+
+    async def kucoin_timestamp(self, request):
+        return kucoin_ok(now_ms())
+
+    async def kucoin_level2(self, request):
+        return kucoin_ok({"sequence": str(self.book_sequence), "time": now_ms(),
+                          "bids": self.book_levels('bids'), "asks": self.book_levels('asks')})
+
+    def kucoin_asset(self, currency):
+        account = self.kucoin_account
+        return {"currency": currency, "borrowEnabled": True, "transferInEnabled": True,
+                "liability": f"{account.liability(currency):.8f}", "total": f"{account.total(currency):.8f}",
+                "available": f"{account.total(currency):.8f}", "hold": "0", "maxBorrowSize": "1000000"}
+
+    async def kucoin_accounts(self, request):
+        account = self.kucoin_account
+        total = account.total(account.quote) + account.total(account.base) * self.price
+        liability = account.liability(account.quote) + account.liability(account.base) * self.price
+        return kucoin_ok({
+            "totalAssetOfQuoteCurrency": f"{total:.8f}",
+            "totalLiabilityOfQuoteCurrency": f"{liability:.8f}",
+            "timestamp": now_ms(),
+            "assets": [{"symbol": self.kucoin_symbol, "status": "EFFECTIVE", "debtRatio": "0",
+                        "baseAsset": self.kucoin_asset(account.base), "quoteAsset": self.kucoin_asset(account.quote)}]
+        })
+
+    async def kucoin_repay(self, request):
+        body = await request.json()
+        account = self.kucoin_account
+        size = min(float(body['size']), account.liability(body['currency']))
+        account.balances[body['currency']] += size
+        self.kucoin_push_position()
+        return kucoin_ok({"timestamp": now_ms(), "orderNo": uuid.uuid4().hex[:24], "actualSize": f"{size:.8f}"})
+
+    async def kucoin_symbols(self, request):
+        base, quote = self.kucoin_symbol.split('-')
+        return kucoin_ok([{
+            "symbol": self.kucoin_symbol, "name": self.kucoin_symbol, "baseCurrency": base, "quoteCurrency": quote,
+            "feeCurrency": quote, "market": quote, "baseMinSize": "0.00001", "quoteMinSize": "0.1", "baseMaxSize": "10000000000",
+            "quoteMaxSize": "99999999", "baseIncrement": "0.00000001", "quoteIncrement": "0.000001", "priceIncrement": "0.1",
+            "priceLimitRate": "0.1", "minFunds": "0.1", "isMarginEnabled": True, "enableTrading": True
+        }])
+
+    async def kucoin_bullet(self, request):
+        host = request.host
+        return kucoin_ok({
+            "token": uuid.uuid4().hex,
+            "instanceServers": [{"endpoint": f"ws://{host}/kucoin/ws", "encrypt": False, "protocol": "websocket",
+                                 "pingInterval": 18000, "pingTimeout": 10000}]
+        })
+
+    async def kucoin_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        topics = set()
+        self.kucoin_public[ws] = topics
+        await ws.send_json({"id": request.query.get('token', ''), "type": "welcome"})
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                if data.get('type') == 'ping':
+                    await ws.send_json({"id": data.get('id'), "type": "pong", "timestamp": now_ms() * 1000})
+                elif data.get('type') == 'subscribe':
+                    topics.add(data['topic'])
+                    if data.get('privateChannel'):
+                        self.kucoin_private[ws] = topics
+                    if data.get('response'):
+                        await ws.send_json({"id": data.get('id'), "type": "ack"})
+                elif data.get('type') == 'unsubscribe':
+                    topics.discard(data['topic'])
+                    if data.get('response'):
+                        await ws.send_json({"id": data.get('id'), "type": "ack"})
+        finally:
+            self.kucoin_public.pop(ws, None)
+            self.kucoin_private.pop(ws, None)
+        return ws
+
+    def kucoin_push(self, clients, topic, subject, data):
+        msg = json.dumps({"type": "message", "topic": topic, "subject": subject, "data": data})
+        for ws, topics in list(clients.items()):
+            if topic in topics and not ws.closed:
+                asyncio.ensure_future(ws.send_str(msg))
+
+    def kucoin_push_ticker(self):
+        self.kucoin_push(self.kucoin_public, f"/market/ticker:{self.kucoin_symbol}", "trade.ticker", {
+            "sequence": str(self.sequence), "price": str(self.price), "size": "0.001",
+            "bestAsk": str(self.ask), "bestAskSize": "1", "bestBid": str(self.bid), "bestBidSize": "1", "time": now_ms()
+        })
+
+    def kucoin_push_level2(self):
+        changes = self.book_changes
+        sequences = [seq for side in changes.values() for _, _, seq in side]
+        if not sequences:
+            return
+        self.kucoin_push(self.kucoin_public, f"/market/level2:{self.kucoin_symbol}", "trade.l2update", {
+            "changes": {side: [[f"{price:.2f}", f"{size:.8f}", str(seq)] for price, size, seq in levels] for side, levels in changes.items()},
+            "sequenceStart": min(sequences), "sequenceEnd": max(sequences), "symbol": self.kucoin_symbol, "time": now_ms()
+        })
+
+    def kucoin_push_position(self):
+        account = self.kucoin_account
+        change = {currency: {"total": f"{account.total(currency):.8f}", "hold": "0",
+                             "liabilityPrincipal": f"{account.liability(currency):.8f}", "liabilityInterest": "0"}
+                  for currency in (account.base, account.quote)}
+        self.kucoin_push(self.kucoin_private, f"/margin/isolatedPosition:{self.kucoin_symbol}", "positionChange", {
+            "tag": self.kucoin_symbol, "status": "DEBT", "statusBizType": "DEFAULT_DEBT",
+            "accumulatedPrincipal": "0", "changeAssets": change, "timestamp": now_ms()
+        })
+
+    # market orders fill in one match
+    def kucoin_push_order(self, order, price):
+        data = {"symbol": order['symbol'], "orderType": order['type'], "side": order['side'], "orderId": order['id'],
+                "clientOid": order['clientOid'], "size": order['size'], "filledSize": order['dealSize'], "remainSize": "0", "ts": time.time_ns()}
+        self.kucoin_push(self.kucoin_private, "/spotMarket/tradeOrdersV2", "orderChange",
+                         {**data, "type": "match", "status": "match", "matchPrice": str(price), "matchSize": order['dealSize']})
+        self.kucoin_push(self.kucoin_private, "/spotMarket/tradeOrdersV2", "orderChange", {**data, "type": "filled", "status": "done"})
+
+    def kucoin_push_advanced(self, order_id, stop, kind):
+        self.kucoin_push(self.kucoin_private, "/spotMarket/advancedOrders", "stopOrder", {
+            "orderId": order_id, "clientOid": stop['clientOid'], "symbol": self.kucoin_symbol, "side": stop['side'],
+            "orderType": "stop", "stop": stop['stop'], "stopPrice": str(stop['stopPrice']), "size": str(stop['size']),
+            "tradeType": "MARGIN_ISOLATED_TRADE", "type": kind, "ts": time.time_ns()
+        })
+
+    # ============ Binance ============
+
+    def binance_report(self, order, status, last_qty=0.0, last_price=0.0):
+        msg = json.dumps({
+            "e": "executionReport", "E": now_ms(), "s": self.binance_symbol, "c": order['clientOrderId'],
+            "S": order['side'], "o": order['type'], "f": "GTC", "q": order['origQty'], "p": order['price'],
+            "P": order.get('stopPrice', "0.00000000"), "x": "TRADE" if status in ('FILLED', 'PARTIALLY_FILLED') else status,
+            "X": status, "i": order['orderId'], "l": f"{last_qty:.8f}", "z": order['executedQty'], "Z": order['cummulativeQuoteQty'], "L": f"{last_price:.8f}",
+            "n": f"{last_qty * last_price * self.fee:.8f}", "N": "USDT", "T": now_ms(), "g": order.get('orderListId', -1)
+        })
+        for clients in self.listen_keys.values():
+            for ws in list(clients):
+                if not ws.closed:
+                    asyncio.ensure_future(ws.send_str(msg))
+
+    def binance_new_order(self, side, order_type, quantity, price="0.00000000", stopPrice=None, clientOrderId=None, orderListId=-1):
+        order = {
+            "symbol": self.binance_symbol, "orderId": next(self.ids), "clientOrderId": clientOrderId or uuid.uuid4().hex[:22],
+            "transactTime": now_ms(), "price": price, "origQty": quantity, "executedQty": "0", "cummulativeQuoteQty": "0",
+            "status": "NEW", "timeInForce": "GTC", "type": order_type, "side": side, "orderListId": orderListId, "isIsolated": True
+        }
+        if stopPrice is not None:
+            order['stopPrice'] = stopPrice
+        self.binance_orders[order['orderId']] = order
+        return order
+
+    def binance_fill(self, order, price):
+        qty = float(order['origQty'])
+        self.binance_account.trade(order['side'].lower(), qty, price, self.fee)
+        order.update({"executedQty": order['origQty'], "cummulativeQuoteQty": f"{qty * price:.8f}", "status": "FILLED"})
+        self.binance_report(order, "FILLED", qty, price)
+        return [{"price": f"{price:.2f}", "qty": order['origQty'], "commission": f"{qty * price * self.fee:.8f}", "commissionAsset": "USDT"}]
+
+    def binance_trigger(self):
+        for list_id, legs in list(self.binance_oco.items()):
+            for i, leg in enumerate(legs):
+                sell = leg['side'] == 'SELL'
+                if leg['type'] == 'LIMIT_MAKER':
+                    hit = self.price >= float(leg['price']) if sell else self.price <= float(leg['price'])
+                else:
+                    hit = self.price <= float(leg['stopPrice']) if sell else self.price >= float(leg['stopPrice'])
+                if hit:
+                    price = float(leg['price']) if leg['type'] == 'LIMIT_MAKER' else self.fill_price(leg['side'].lower())
+                    self.binance_fill(leg, price)
+                    other = legs[1 - i]
+                    other['status'] = 'EXPIRED'
+                    self.binance_report(other, 'EXPIRED')
+                    del self.binance_oco[list_id]
+                    break
+
+    async def binance_ticker_price(self, request):
+        return web.json_response({"symbol": request.query.get('symbol', self.binance_symbol), "price": f"{self.price:.2f}"})
+
+    async def binance_depth(self, request):
+        limit = int(request.query.get('limit', 100))
+        return web.json_response({"lastUpdateId": self.book_sequence, "bids": self.book_levels('bids', limit), "asks": self.book_levels('asks', limit)})
+
+    async def binance_exchange_info(self, request):
+        account = self.binance_account
+        return web.json_response({"timezone": "UTC", "serverTime": now_ms(), "rateLimits": [], "symbols": [{
+            "symbol": self.binance_symbol, "status": "TRADING", "baseAsset": account.base, "baseAssetPrecision": 8,
+            "quoteAsset": account.quote, "quotePrecision": 8, "quoteAssetPrecision": 8, "isMarginTradingAllowed": True,
+            "filters": [
+                {"filterType": "PRICE_FILTER", "minPrice": "0.01", "maxPrice": "1000000.00", "tickSize": "0.01"},
+                {"filterType": "LOT_SIZE", "minQty": "0.00001", "maxQty": "9000.00000", "stepSize": "0.00001"},
+                {"filterType": "NOTIONAL", "minNotional": "5.00000000", "applyMinToMarket": True}
+            ]
+        }]})
+
+    def binance_asset(self, currency):
+        account = self.binance_account
+        net = account.balances[currency]
+        return {"asset": currency, "borrowEnabled": True, "borrowed": f"{account.liability(currency):.8f}",
+                "free": f"{account.total(currency):.8f}", "interest": "0", "locked": "0", "netAsset": f"{net:.8f}",
+                "netAssetOfBtc": "0", "repayEnabled": True, "totalAsset": f"{account.total(currency):.8f}"}
+
+    async def binance_isolated_account(self, request):
+        account = self.binance_account
+        return web.json_response({"assets": [{
+            "baseAsset": self.binance_asset(account.base), "quoteAsset": self.binance_asset(account.quote),
+            "symbol": self.binance_symbol, "isolatedCreated": True, "enabled": True, "marginLevel": "999",
+            "marginLevelStatus": "EXCESSIVE", "marginRatio": "10", "indexPrice": f"{self.price:.2f}",
+            "liquidatePrice": "0", "liquidateRate": "0", "tradeEnabled": True
+        }]})
+
+    async def binance_margin_order(self, request):
+        params = request.query
+        if params.get('type') != 'MARKET':
+            return binance_error(400, -1116, "Only MARKET orders are simulated.")
+        order = self.binance_new_order(params['side'], 'MARKET', params['quantity'], clientOrderId=params.get('newClientOrderId'))
+        self.binance_report(order, "NEW")
+        fills = self.binance_fill(order, self.fill_price(params['side'].lower()))
+        return web.json_response(dict(order, fills=fills))
+
+    async def binance_oco_order(self, request):
+        params = request.query
+        list_id = next(self.ids)
+        limit = self.binance_new_order(params['side'], 'LIMIT_MAKER', params['quantity'], price=params['price'],
+                                       clientOrderId=params.get('limitClientOrderId'), orderListId=list_id)
+        stop = self.binance_new_order(params['side'], 'STOP_LOSS', params['quantity'], stopPrice=params['stopPrice'],
+                                      clientOrderId=params.get('stopClientOrderId'), orderListId=list_id)
+        self.binance_oco[list_id] = [stop, limit]
+        for order in (stop, limit):
+            self.binance_report(order, "NEW")
+        return web.json_response({
+            "orderListId": list_id, "contingencyType": "OCO", "listStatusType": "EXEC_STARTED", "listOrderStatus": "EXECUTING",
+            "listClientOrderId": uuid.uuid4().hex[:22], "transactionTime": now_ms(), "symbol": self.binance_symbol, "isIsolated": True,
+            "orders": [{"symbol": self.binance_symbol, "orderId": o['orderId'], "clientOrderId": o['clientOrderId']} for o in (stop, limit)],
+            "orderReports": [stop, limit]
+        })
+
+    async def binance_open_oco(self, request):
+        return web.json_response([{"orderListId": list_id, "contingencyType": "OCO", "symbol": self.binance_symbol,
+                                   "orders": [{"orderId": o['orderId'], "clientOrderId": o['clientOrderId']} for o in legs]}
+                                  for list_id, legs in self.binance_oco.items()])
+
+    async def binance_cancel_open(self, request):
+        cancelled = []
+        for legs in self.binance_oco.values():
+            for order in legs:
+                order['status'] = 'CANCELED'
+                self.binance_report(order, 'CANCELED')
+                cancelled.append(order)
+        self.binance_oco.clear()
+        return web.json_response(cancelled)
+
+    async def binance_listen_key(self, request):
+        if request.method == 'POST':
+            key = uuid.uuid4().hex * 2
+            self.listen_keys[key] = set()
+            return web.json_response({"listenKey": key})
+        if request.query.get('listenKey') not in self.listen_keys:
+            return binance_error(400, -1125, "This listenKey does not exist.")
+        if request.method == 'DELETE':
+            for ws in self.listen_keys.pop(request.query['listenKey']):
+                asyncio.ensure_future(ws.close())
+        return web.json_response({})
+
+    async def binance_user_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        clients = self.listen_keys.setdefault(request.match_info['listen_key'], set())
+        clients.add(ws)
+        try:
+            async for msg in ws:
+                pass
+        finally:
+            clients.discard(ws)
+        return ws
+
+    async def binance_stream_ws(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.binance_market[ws] = set(request.query.get('streams', '').split('/'))
+        try:
+            async for msg in ws:
+                pass
+        finally:
+            self.binance_market.pop(ws, None)
+        return ws
+
+    def binance_push_market(self):
+        s = self.binance_symbol.lower()
+        t = now_ms()
+        payloads = {
+            f"{s}@trade": {"e": "trade", "E": t, "s": self.binance_symbol, "t": self.sequence, "p": f"{self.price:.2f}",
+                           "q": "0.00100000", "T": t, "m": False, "M": True},
+            f"{s}@bookTicker": {"u": self.sequence, "s": self.binance_symbol, "b": f"{self.bid:.2f}", "B": "1.00000000",
+                                "a": f"{self.ask:.2f}", "A": "1.00000000"}
+        }
+        changes = self.book_changes
+        sequences = [seq for side in changes.values() for _, _, seq in side]
+        if sequences:
+            payloads[f"{s}@depth@100ms"] = payloads[f"{s}@depth"] = {
+                "e": "depthUpdate", "E": t, "s": self.binance_symbol, "U": min(sequences), "u": max(sequences),
+                "b": [[f"{price:.2f}", f"{size:.8f}"] for price, size, _ in changes['bids']],
+                "a": [[f"{price:.2f}", f"{size:.8f}"] for price, size, _ in changes['asks']]
+            }
+        for ws, streams in list(self.binance_market.items()):
+            if ws.closed:
+                continue
+            for stream in streams & payloads.keys():
+                asyncio.ensure_future(ws.send_str(json.dumps({"stream": stream, "data": payloads[stream]})))
+
+    # ============ Application ============
+
+    def app(self):
+        app = web.Application(middlewares=[self.inject])
+        app.add_routes([
+            web.get('/sim/stats', self.sim_stats),
+            web.post('/sim/disconnect', self.sim_disconnect),
+            # KuCoin
+            web.post('/api/v3/hf/margin/order', self.kucoin_market_order),
+            web.get('/api/v3/hf/margin/orders/{order_id}', self.kucoin_order_info),
+            web.post('/api/v1/margin/order', self.kucoin_market_order),
+            web.post('/api/v1/stop-order', self.kucoin_stop_order),
+            web.delete('/api/v1/orders/{order_id}', self.kucoin_cancel),
+            web.delete('/api/v1/stop-order/{order_id}', self.kucoin_cancel),
+            web.get('/api/v1/mark-price/{ticker}/current', self.kucoin_mark_price),
+            web.get('/api/v1/market/orderbook/level1', self.kucoin_level1),
+            web.get('/api/v1/timestamp', self.kucoin_timestamp),
+            web.get('/api/v3/market/orderbook/level2', self.kucoin_level2),
+            web.get('/api/v3/isolated/accounts', self.kucoin_accounts),
+            web.post('/api/v3/margin/repay', self.kucoin_repay),
+            web.get('/api/v2/symbols', self.kucoin_symbols),
+            web.post('/api/v1/bullet-public', self.kucoin_bullet),
+            web.post('/api/v1/bullet-private', self.kucoin_bullet),
+            web.get('/kucoin/ws', self.kucoin_ws),
+            # Binance
+            web.get('/api/v3/ticker/price', self.binance_ticker_price),
+            web.get('/api/v3/exchangeInfo', self.binance_exchange_info),
+            web.get('/api/v3/depth', self.binance_depth),
+            web.get('/sapi/v1/margin/isolated/account', self.binance_isolated_account),
+            web.post('/sapi/v1/margin/order', self.binance_margin_order),
+            web.post('/sapi/v1/margin/order/oco', self.binance_oco_order),
+            web.get('/sapi/v1/margin/openOrderList', self.binance_open_oco),
+            web.delete('/sapi/v1/margin/openOrders', self.binance_cancel_open),
+            web.post('/sapi/v1/userDataStream/isolated', self.binance_listen_key),
+            web.put('/sapi/v1/userDataStream/isolated', self.binance_listen_key),
+            web.delete('/sapi/v1/userDataStream/isolated', self.binance_listen_key),
+            web.get('/ws/{listen_key}', self.binance_user_ws),
+            web.get('/stream', self.binance_stream_ws),
+        ])
+
+        async def run_path(app):
+            task = asyncio.create_task(self.run_path())
+            yield
+            task.cancel()
+
+        app.cleanup_ctx.append(run_path)
+        return app
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Local KuCoin/Binance exchange simulator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--prices', help="scripted price path: tick store directory, .csv or .jsonl, random walk if omitted")
+    parser.add_argument('--start-price', type=float, default=60000.0)
+    parser.add_argument('--tick-interval', type=float, default=0.1, help="seconds between ticks")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every REST response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="uniform +/- seconds around latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of REST requests answered with 429")
+    parser.add_argument('--fee', type=float, default=0.001)
+    parser.add_argument('--balance', type=float, default=1000.0, help="starting quote balance")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    path = PricePath.load(args.prices) if args.prices else PricePath.random_walk(args.start_price, seed=args.seed)
+    sim = Simulator(path, fee=args.fee, tick_interval=args.tick_interval, latency=args.latency, jitter=args.jitter,
+                    error_rate=args.error_rate, quote_balance=args.balance, seed=args.seed)
+    web.run_app(sim.app(), host=args.host, port=args.port)
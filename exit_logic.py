@@ -0,0 +1,38 @@
+# Exit decisions shared by the live monitors in kucoin_bot and the backtester
+
+TAKE_PROFIT = 'take_profit'
+STOP_LOSS = 'stop_loss'
+
+# what the monitor does once an exit level is hit
+MARKET_EXIT = 'market_exit' # leveraged long, no exchange stops, close with a market order
+CANCEL_STOP_LOSS = 'cancel_stop_loss' # the take profit stop order filled, cancel the other leg
+CANCEL_TAKE_PROFIT = 'cancel_take_profit' # the stop loss stop order filled, cancel the other leg
+
+LABELS = {TAKE_PROFIT: 'take profit', STOP_LOSS: 'stop loss'}
+
+
+# exit level hit by price, or None
+def check_exit(side, price, TP, SL):
+    if side == 'buy':
+        if price >= TP:
+            return TAKE_PROFIT
+        if price <= SL:
+            return STOP_LOSS
+    else:
+        if price <= TP:
+            return TAKE_PROFIT
+        if price >= SL:
+            return STOP_LOSS
+    return None
+
+
+# monitor reaction to an exit level being hit
+def exit_action(hit, leveraged):
+    if leveraged:
+        return MARKET_EXIT
+    return CANCEL_STOP_LOSS if hit == TAKE_PROFIT else CANCEL_TAKE_PROFIT
+
+
+# opposite side, used to flatten a position
+def exit_side(side):
+    return 'sell' if side == 'buy' else 'buy'
@@ -0,0 +1,92 @@
+# libraries
+import time
+
+# private topic pushing isolated margin position changes
+POSITION_PREFIX = "/margin/isolatedPosition:"
+
+
+# One currency of an isolated margin pair
+class AssetBalance:
+    __slots__ = ('currency', 'total', 'available', 'hold', 'liability')
+
+    def __init__(self, currency=None, total=0.0, available=0.0, hold=0.0, liability=0.0):
+        self.currency = currency
+        self.total = total
+        self.available = available
+        self.hold = hold
+        self.liability = liability
+
+    def as_dict(self):
+        return {
+            'currency': self.currency,
+            'total': self.total,
+            'available': self.available,
+            'hold': self.hold,
+            'liability': self.liability
+        }
+
+
+# Local isolated margin account, loaded once over REST then kept current by the private stream
+class IsolatedAccount:
+
+    def __init__(self, symbol: str = "BTC-USDT"):
+
+        self.symbol = symbol
+        self.base = AssetBalance()
+        self.quote = AssetBalance()
+        self.updated = None
+        self._pending = [] # pushes that arrived before the REST snapshot
+
+    @property
+    def topic(self):
+        return f"{POSITION_PREFIX}{self.symbol}"
+
+    @property
+    def loaded(self):
+        return self.updated is not None
+
+    # load from a get_account_info response
+    def load(self, response):
+        for asset in response['data']['assets']:
+            if asset['symbol'] != self.symbol:
+                continue
+            for balance, data in ((self.base, asset['baseAsset']), (self.quote, asset['quoteAsset'])):
+                balance.currency = data['currency']
+                balance.total = float(data['total'])
+                balance.available = float(data['available'])
+                balance.hold = float(data['hold'])
+                balance.liability = float(data['liability'])
+            self.updated = time.monotonic()
+
+        # replay the pushes newer than the snapshot
+        snapshot_time = int(response['data'].get('timestamp') or 0)
+        pending, self._pending = self._pending, []
+        for data in pending:
+            if int(data.get('timestamp') or 0) > snapshot_time:
+                self.update(data)
+        return self
+
+    # private stream callback, message data of the isolated position topic
+    def update(self, data):
+        if data.get('tag', self.symbol) != self.symbol:
+            return
+        # currencies are only known once the snapshot is loaded, until then pushes wait for it
+        if not self.loaded:
+            self._pending.append(data)
+            return
+        applied = False
+        for currency, change in data.get('changeAssets', {}).items():
+            balance = self.base if currency == self.base.currency else self.quote if currency == self.quote.currency else None
+            if balance is None:
+                continue
+            balance.total = float(change['total'])
+            balance.hold = float(change['hold'])
+            balance.available = balance.total - balance.hold
+            balance.liability = float(change['liabilityPrincipal']) + float(change['liabilityInterest'])
+            applied = True
+        if applied:
+            self.updated = time.monotonic()
+
+    # equivalent of totalAssetOfQuoteCurrency at the given base price
+    def total_in_quote(self, price):
+        return self.quote.total + self.base.total * price
@@ -4,48 +4,111 @@ import json
 from dotenv import load_dotenv
 import os
 from kucoin_auth import KucoinClient
+from order_book import risk_size
+from rate_limit import RateLimiter, endpoint_limit, CRITICAL, NORMAL, LOW
 import requests
 from urllib.parse import urlencode
 import requests
 import uuid
 from typing import Dict, Any
 import logging
+import asyncio
+import aiohttp
 
 # load environment 
 load_dotenv()
+
+# compact JSON body encoder, orjson when it is installed
+try:
+    import orjson
+    encode_body = orjson.dumps
+except ImportError:
+    _encoder = json.JSONEncoder(separators=(',', ':'))
+    def encode_body(body):
+        return _encoder.encode(body).encode('utf-8')
     
+# (method, path prefix, resource pool, weight, priority) per endpoint, weights of the KuCoin docs at VIP 0
+KUCOIN_LIMITS = [
+    ('POST', '/api/v3/hf/margin/order', 'spot', 5, CRITICAL),
+    ('POST', '/api/v1/margin/order', 'spot', 5, CRITICAL),
+    ('POST', '/api/v1/stop-order', 'spot', 3, CRITICAL),
+    ('DELETE', '/api/v1/stop-order/', 'spot', 3, CRITICAL),
+    ('DELETE', '/api/v1/orders/', 'spot', 3, CRITICAL),
+    ('POST', '/api/v3/margin/repay', 'spot', 10, CRITICAL),
+    ('GET', '/api/v3/hf/margin/orders/', 'spot', 5, LOW),
+    ('GET', '/api/v3/market/orderbook/level2', 'spot', 3, LOW),
+    ('GET', '/api/v3/isolated/accounts', 'management', 15, LOW),
+    ('GET', '/api/v1/mark-price/', 'public', 2, NORMAL),
+    ('GET', '/api/v1/market/orderbook/level1', 'public', 2, NORMAL),
+    ('POST', '/api/v1/bullet-public', 'public', 10, NORMAL),
+    ('POST', '/api/v1/bullet-private', 'spot', 10, NORMAL),
+    ('GET', '/api/v2/symbols', 'public', 4, LOW),
+    ('GET', '/api/v1/timestamp', 'public', 3, LOW),
+]
+
+# mark price tickers are quoted the other way round, BTC-USDT -> USDT-BTC
+def inverse(symbol):
+    base, quote = symbol.split('-')
+    return f"{quote}-{base}"
+
+# Order body serialized ahead of time, the signature is the only thing left to compute when it is sent.
+# KuCoin signs timestamp + method + endpoint + body, so nothing past the keyed HMAC state can be hashed in advance.
+class ArmedOrder:
+    __slots__ = ('client_oid', 'url', 'payload', 'body')
+
+    def __init__(self, client_oid, url, payload, body):
+        self.client_oid = client_oid
+        self.url = url
+        self.payload = payload # method + endpoint + body, the signed bytes after the timestamp
+        self.body = body
+
+    def __repr__(self):
+        return f"ArmedOrder({self.client_oid} {self.body.decode()})"
+
+
 # Kucoin API class
 class KucoinAPI:
 
-    def __init__(self, api_key: str, api_secret: str, passphrase: str):
+    def __init__(self, api_key: str, api_secret: str, passphrase: str, base_url: str = None):
 
         self.signer = KucoinClient(api_key, api_secret, passphrase)
         self.session = requests.Session()
         self.host = "api.kucoin.com"
-        self.base_url = f"https://{self.host}"
+        self.base_url = base_url or f"https://{self.host}"
+        self.price_cache = None # optional PriceCache fed by the ticker stream
+        self.account = None # optional IsolatedAccount fed by the private stream
+        self.symbols = None # optional SymbolRegistry with lot, tick and minimum funds rules
+        self.order_book = None # optional OrderBook fed by the level2 stream, for the expected fill
 
-    def _request(self, method, endpoint, params=None, body=None, auth_required=True):
+    def _prepare(self, method, endpoint, params=None, body=None, auth_required=True):
 
         url = f"{self.base_url}{endpoint}"
-        headers = {}
 
         if params:
             query_string = urlencode(params)
             url += f"?{query_string}"
             endpoint += f"?{query_string}"
 
-        if body:
-            body = json.dumps(body)
-            headers = {'Content-Type': 'application/json'}
+        # serialize once, the same bytes are signed and sent
+        body = encode_body(body) if body else None
+
+        if auth_required:
+            payload = (method + endpoint).encode('utf-8')
+            headers = self.signer.headers(payload + body if body else payload)
         else:
             headers = {}
 
-        if auth_required:
-            payload = method + endpoint + (body or '')
-            headers.update(self.signer.headers(payload))
+        if body:
+            headers['Content-Type'] = 'application/json'
+
+        return url, headers, body
+
+    def _request(self, method, endpoint, params=None, body=None, auth_required=True):
+
+        url, headers, body = self._prepare(method, endpoint, params, body, auth_required)
 
         try:
-            response = requests.request(method, url, headers=headers, data=body)
+            response = self.session.request(method, url, headers=headers, data=body)
             return response.json()
         
         except requests.exceptions.RequestException as e:
@@ -61,13 +124,25 @@ class KucoinAPI:
                     order_type: str = "market",
                     is_isolated: bool = True,
                     auto_borrow: bool = True,
-                    auto_repay: bool = True):
+                    auto_repay: bool = True,
+                    client_oid: str = None):
+
+        # Make the API request
+        return self._request(
+            method="POST",
+            endpoint="/api/v3/hf/margin/order",
+            body=self._order_v3(side, funds, size, price, symbol, order_type, is_isolated, auto_borrow, auto_repay, client_oid)
+        )
+
+    # order body shared by place_order_v3 and arm_order_v3
+    def _order_v3(self, side, funds=None, size=None, price=None, symbol="BTC-USDT", order_type="market",
+                  is_isolated=True, auto_borrow=True, auto_repay=True, client_oid=None):
     
         # Prepare order data
         data = {
             "symbol": symbol,
             "side": side,
-            "clientOid": str(uuid.uuid4()),
+            "clientOid": client_oid or str(uuid.uuid4()),
             "type": order_type,
             "isIsolated": is_isolated,
             "autoBorrow": auto_borrow,
@@ -85,12 +160,28 @@ class KucoinAPI:
         else:
             raise ValueError("Must provide size for sell orders or funds for buy orders")
 
-        # Make the API request
-        return self._request(
-            method="POST",
-            endpoint="/api/v3/hf/margin/order",
-            body=data
-        )
+        return data
+
+    def arm_order_v3(self, side: str, size: str = None, funds: str = None, symbol: str = "BTC-USDT", **kwargs):
+        """
+        Builds, serializes and prepares the signing payload of an HF margin order now, to be sent later with fire().
+        Keyword arguments are those of place_order_v3.
+        """
+        data = self._order_v3(side, funds=funds, size=size, symbol=symbol, **kwargs)
+        endpoint = "/api/v3/hf/margin/order"
+        body = encode_body(data)
+        return ArmedOrder(data['clientOid'], f"{self.base_url}{endpoint}", b"POST" + endpoint.encode('utf-8') + body, body)
+
+    # send an armed order, only the timestamp and signature are computed here
+    def fire(self, armed):
+        headers = self.signer.headers(armed.payload)
+        headers['Content-Type'] = 'application/json'
+        try:
+            response = self.session.post(armed.url, headers=headers, data=armed.body)
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Request error: {str(e)}")
+            return {"error": str(e)}
     
     def get_order_info(self, orderID: str = None, symbol: str = "BTC-USDT"):
         
@@ -114,6 +205,26 @@ class KucoinAPI:
             auth_required=False
         )
     
+    # best bid/ask and last trade
+    def get_level1(self, symbol="BTC-USDT"):
+
+        return self._request(
+            method="GET",
+            endpoint="/api/v1/market/orderbook/level1",
+            params={"symbol": symbol},
+            auth_required=False
+        )
+
+    # full order book snapshot, the starting point of the level2 diffs
+    def get_level2(self, symbol="BTC-USDT"):
+
+        return self._request(
+            method="GET",
+            endpoint="/api/v3/market/orderbook/level2",
+            params={"symbol": symbol},
+            auth_required=True
+        )
+
     # isolated margin account info
     def get_account_info(self, symbol="BTC-USDT", quoteCurrency="USDT", queryType="ISOLATED"):
         params = {}
@@ -156,13 +267,14 @@ class KucoinAPI:
                     symbol: str = "BTC-USDT",
                     tradeType: str = "MARGIN_ISOLATED_TRADE",
                     order_type: str = "market",
-                    stop = None
+                    stop = None,
+                    client_oid: str = None
                     ):
     
         data = {
             "symbol": symbol,
             "side": side,
-            "clientOid": str(uuid.uuid4()),
+            "clientOid": client_oid or str(uuid.uuid4()),
             "type": order_type,
             "stopPrice": stopPrice,
             "tradeType": tradeType,
@@ -190,13 +302,14 @@ class KucoinAPI:
                      price: str = None,
                      marginModel: str = "isolated",
                      auto_borrow: bool = False,
-                     auto_repay: bool = False):
+                     auto_repay: bool = False,
+                     client_oid: str = None):
           
         # Prepare order data
         data = {
             "symbol": symbol,
             "side": side,
-            "clientOid": str(uuid.uuid4()),
+            "clientOid": client_oid or str(uuid.uuid4()),
             "type": type,
             "marginModel": marginModel,
             "autoBorrow": auto_borrow,
@@ -214,10 +327,28 @@ class KucoinAPI:
             body=data
         )
     
-    def live_stream_id(self):
+    # server time, also used to keep pooled connections warm
+    def get_server_time(self):
+        return self._request(
+            method="GET",
+            endpoint="/api/v1/timestamp",
+            auth_required=False
+        )
+
+    # trading rules of every pair
+    def get_symbols(self, market: str = None):
+        return self._request(
+            method="GET",
+            endpoint="/api/v2/symbols",
+            params={"market": market} if market else None,
+            auth_required=False
+        )
+
+    # bullet token, data['instanceServers'] lists the websocket endpoints to connect to
+    def live_stream_id(self, private: bool = False):
         return self._request(
             method='POST',
-            endpoint='/api/v1/bullet-public'
+            endpoint='/api/v1/bullet-private' if private else '/api/v1/bullet-public'
         )
 
 
@@ -227,7 +358,45 @@ class KucoinAPI:
             endpoint=f"/api/v1/orders/{order_id}"
         )
 
-    def pricer(self, side, stopLoss, RR=1.5, Risk=1, f=0.001, tp_type='ideal'):
+    def pricer(self, side, stopLoss, RR=1.5, Risk=1, f=0.001, tp_type='ideal', max_staleness=None, symbol="BTC-USDT"):
+
+        # get current price, from the streaming cache unless it is stale
+        P = self._cached_price(max_staleness)
+        if P is None:
+            price_request = self.get_last_price(ticker=inverse(symbol))
+            P = 1/price_request['data']['value']
+        if P is None:
+            print('Price not fetched correctly')
+            return
+
+        # get current account balance
+        M = self._cached_balance(P)
+        if M is None:
+            M = self.get_account_info(symbol=symbol, quoteCurrency=symbol.split("-")[1])['data']['totalAssetOfQuoteCurrency']
+
+        return self._size(side, stopLoss, P, M, RR, Risk, f, tp_type, self._rules(symbol), self._book(symbol))
+
+    def _cached_price(self, max_staleness=None):
+        if self.price_cache is None:
+            return None
+        return self.price_cache.price(max_staleness)
+
+    def _cached_balance(self, P):
+        if self.account is None or not self.account.loaded:
+            return None
+        return self.account.total_in_quote(P)
+
+    def _book(self, symbol):
+        if self.order_book is None or self.order_book.symbol != symbol:
+            return None
+        return self.order_book
+
+    def _rules(self, symbol):
+        if self.symbols is None:
+            return None
+        return self.symbols.get(symbol)
+
+    def _size(self, side, stopLoss, P, M, RR, Risk, f, tp_type, info=None, book=None):
 
         # trade param
         if isinstance(stopLoss, str):
@@ -235,14 +404,6 @@ class KucoinAPI:
         else:
             SL = stopLoss
 
-        # get current price
-        P = None
-        price_request = self.get_last_price(ticker="USDT-BTC")
-        P = 1/price_request['data']['value']
-        if P is None:
-            print('Price not fetched correctly')
-            return
-
         # determine direction
         d = 1 if side == "buy" else -1 if side == "sell" else None
         if d is None:
@@ -253,23 +414,41 @@ class KucoinAPI:
             print('stop loss and order direction inconsistent')
             return None
 
-        # get current account balance
-        M = self.get_account_info()['data']['totalAssetOfQuoteCurrency']
-
-        # compute n
-        n = Risk / (SL*(f-d) + P*(f + d))
+        # compute n, entering at the expected fill of the live book rather than at P when there is one
+        sized = risk_size(side, SL, P, Risk, f, book)
+        if sized is None:
+            print('order book too thin for the position size')
+            return None
+        n, E, worst = sized
 
         # compute position size in USDT terms
-        V = n*P
+        V = n*E
 
         # compute take profit
         if tp_type=='ideal':
-            TP = P + RR*(P-SL)
+            TP = E + RR*(E-SL)
         elif tp_type=='real':
-            TP = (Risk * RR + n*P*(f+d))/(n*(d-f))
+            TP = (Risk * RR + n*E*(f+d))/(n*(d-f))
+
+        # round to the pair's lot, tick and quote steps when its rules are loaded
+        if info is not None:
+            if not info.tradable(n, P):
+                print('position below the minimum order size')
+                return None
+            return {
+                'price': P,
+                'vwap': E,
+                'worstPrice': worst,
+                'balanceBefore': M,
+                'takeProfit': info.round_price(TP),
+                'size': info.round_size(n),
+                'funds': info.round_funds(V)
+            }
 
         return {
             'price': P,
+            'vwap': E,
+            'worstPrice': worst,
             'balanceBefore': M,
             'takeProfit': round(TP,0),
             'size': round(n,8),
@@ -277,6 +456,115 @@ class KucoinAPI:
         }
 
 
+# Asyncio Kucoin API class, every endpoint method above returns an awaitable
+class AsyncKucoinAPI(KucoinAPI):
+
+    def __init__(self, api_key: str, api_secret: str, passphrase: str, base_url: str = None, pool_size: int = 10, timeout: float = 10):
+
+        super().__init__(api_key, api_secret, passphrase, base_url)
+        self.session = None
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        # resource pool quotas per 30 seconds
+        self.limits = {
+            'spot': RateLimiter(4000, 30, name="KuCoin spot"),
+            'management': RateLimiter(2000, 30, name="KuCoin management"),
+            'public': RateLimiter(2000, 30, name="KuCoin public")
+        }
+
+    async def _get_session(self):
+
+        # one pooled keep-alive session, created lazily inside the running loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    # the pool's remaining quota as the gateway reports it, a 429 holds the pool until its window resets
+    def _track(self, limiter, response):
+        remaining = response.headers.get('gw-ratelimit-remaining')
+        reset = response.headers.get('gw-ratelimit-reset')
+        reset = int(reset) / 1000 if reset else None
+        if response.status == 429 and reset:
+            limiter.pause(reset)
+        elif remaining is not None:
+            limiter.sync(remaining=int(remaining), reset=reset)
+
+    async def _request(self, method, endpoint, params=None, body=None, auth_required=True):
+
+        # wait for the pool before signing, so a queued request never goes out with a stale timestamp
+        pool, weight, priority = endpoint_limit(KUCOIN_LIMITS, method, endpoint, ('spot', 5, NORMAL))
+        limiter = self.limits[pool]
+        await limiter.acquire(weight, priority)
+
+        url, headers, body = self._prepare(method, endpoint, params, body, auth_required)
+
+        try:
+            session = await self._get_session()
+            async with session.request(method, url, headers=headers, data=body) as response:
+                self._track(limiter, response)
+                return await response.json(content_type=None)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Request error: {str(e)}")
+            return {"error": str(e)}
+
+    async def fire(self, armed):
+
+        limiter = self.limits['spot']
+        await limiter.acquire(5, CRITICAL)
+        headers = self.signer.headers(armed.payload)
+        headers['Content-Type'] = 'application/json'
+
+        try:
+            session = await self._get_session()
+            async with session.post(armed.url, headers=headers, data=armed.body) as response:
+                self._track(limiter, response)
+                return await response.json(content_type=None)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.error(f"Request error: {str(e)}")
+            return {"error": str(e)}
+
+    async def keep_warm(self, interval: float = 15):
+        """
+        Cheap public request every interval seconds, so an exit order fired after a quiet spell
+        reuses an open keep-alive connection instead of paying for a new TCP and TLS handshake.
+        """
+        while True:
+            await self.get_server_time()
+            await asyncio.sleep(interval)
+
+    async def pricer(self, side, stopLoss, RR=1.5, Risk=1, f=0.001, tp_type='ideal', max_staleness=None, symbol="BTC-USDT"):
+
+        # price and balance from the streaming caches
+        P = self._cached_price(max_staleness)
+        fetch_price = P is None
+        fetch_balance = self.account is None or not self.account.loaded
+
+        # whatever is stale comes from REST, concurrently
+        calls = []
+        if fetch_price:
+            calls.append(self.get_last_price(ticker=inverse(symbol)))
+        if fetch_balance:
+            calls.append(self.get_account_info(symbol=symbol, quoteCurrency=symbol.split("-")[1]))
+        results = list(await asyncio.gather(*calls))
+
+        if fetch_price:
+            P = 1/results.pop(0)['data']['value']
+        if fetch_balance:
+            M = results.pop(0)['data']['totalAssetOfQuoteCurrency']
+        else:
+            M = self._cached_balance(P)
+
+        return self._size(side, stopLoss, P, M, RR, Risk, f, tp_type, self._rules(symbol), self._book(symbol))
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
 if __name__ == '__main__':
 
     key = os.getenv("KUCOIN_API_KEY","")
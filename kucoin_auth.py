@@ -21,22 +21,31 @@ class KucoinClient:
         if not all([api_key, api_secret, api_passphrase]):
             logging.warning("API token is empty. Access is restricted to public interfaces only.")
 
+        # keyed HMAC state and static headers, copied per request instead of rebuilt
+        self._hmac = hmac.new(self.api_secret.encode('utf-8'), digestmod=hashlib.sha256)
+        self._headers = {
+            "KC-API-KEY": self.api_key,
+            "KC-API-PASSPHRASE": self.api_passphrase,
+            "KC-API-KEY-VERSION": "2"
+        }
+
     def sign(self, plain: bytes, key: bytes) -> str:
         hm = hmac.new(key, plain, hashlib.sha256)
         return base64.b64encode(hm.digest()).decode()
 
-    def headers(self, plain: str) -> dict:
+    def headers(self, plain) -> dict:
         """
         Headers method generates and returns a map of signature headers needed for API authorization
-        It takes a plain string as an argument to help form the signature. The outputs are a set of API headers.
+        It takes a plain string (or the exact bytes to be sent) as an argument to help form the signature.
+        The outputs are a set of API headers.
         """
         timestamp = str(int(time.time() * 1000))
-        signature = self.sign((timestamp + plain).encode('utf-8'), self.api_secret.encode('utf-8'))
 
-        return {
-            "KC-API-KEY": self.api_key,
-            "KC-API-PASSPHRASE": self.api_passphrase,
-            "KC-API-TIMESTAMP": timestamp,
-            "KC-API-SIGN": signature,
-            "KC-API-KEY-VERSION": "2"
-        }
\ No newline at end of file
+        hm = self._hmac.copy()
+        hm.update(timestamp.encode('utf-8'))
+        hm.update(plain if isinstance(plain, bytes) else plain.encode('utf-8'))
+
+        headers = self._headers.copy()
+        headers["KC-API-TIMESTAMP"] = timestamp
+        headers["KC-API-SIGN"] = base64.b64encode(hm.digest()).decode()
+        return headers
@@ -3,12 +3,24 @@ from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
 import os
 from dotenv import load_dotenv
 from telegram import Update
-from kucoin_api import KucoinAPI
-import websockets
-import json
+from kucoin_api import AsyncKucoinAPI
+from kucoin_stream import KucoinStream
+from price_cache import PriceCache
+from order_book import OrderBook, LEVEL2_PREFIX, kucoin_snapshot, kucoin_diff
+from kucoin_account import IsolatedAccount
+from alerts import AlertBook
+from positions import PositionBook
+from kucoin_orders import OrderTracker, ORDER_TOPIC, ADVANCED_TOPIC, FILLED
+from tick_store import TickWriter
+from latency import LatencyStats
+from symbols import SymbolRegistry, parse_kucoin
+from retry import retry
+from notifier import Notifier
+from exit_logic import exit_action, exit_side, MARKET_EXIT, CANCEL_STOP_LOSS, LABELS, TAKE_PROFIT, STOP_LOSS
 from collections import defaultdict
-import time
 import asyncio
+import logging
+import uuid
 from telegram.error import NetworkError
 
 # kill previous syncs
@@ -25,11 +37,34 @@ AUTHORIZED_USER_ID = int(os.getenv("AUTHORIZED_USER_ID"))
 key = os.getenv("KUCOIN_API_KEY","")
 secret = os.getenv("KUCOIN_API_SECRET","")
 passphrase = os.getenv("KUCOIN_API_PASSPHRASE","")
-kucoin_api = KucoinAPI(key, secret, passphrase)
+base_url = os.getenv("KUCOIN_BASE_URL") # e.g. a local exchange_sim.py
+kucoin_api = AsyncKucoinAPI(key, secret, passphrase, base_url)
+SYMBOL = os.getenv("KUCOIN_SYMBOL", "BTC-USDT")
 
-# Init Kucoin streaming
-id = kucoin_api.live_stream_id()['data']['token']
-WS_URL = "wss://ws-api-spot.kucoin.com?token={}".format(id)
+# lot size, tick size and minimum funds of every pair, refreshed in the background
+symbols = SymbolRegistry(kucoin_api.get_symbols, parse_kucoin)
+kucoin_api.symbols = symbols
+
+# one shared ticker connection for every monitor, a fresh bullet token on every (re)connect
+TICKER_TOPIC = f"/market/ticker:{SYMBOL}"
+ticker_feed = KucoinStream(token=kucoin_api.live_stream_id, gap_fill=kucoin_api.get_level1)
+
+# last price and best bid/ask for the pricer, kept current by the ticker feed
+price_cache = PriceCache()
+kucoin_api.price_cache = price_cache
+
+# local level 2 book, a REST snapshot kept current by the level2 diffs on the ticker connection
+LEVEL2_TOPIC = f"{LEVEL2_PREFIX}{SYMBOL}"
+order_book = OrderBook(SYMBOL, kucoin_api.get_level2, kucoin_snapshot, kucoin_diff)
+kucoin_api.order_book = order_book
+
+# isolated margin balances, loaded once then kept current by the private stream
+account = IsolatedAccount(SYMBOL)
+account_feed = KucoinStream(token=lambda: kucoin_api.live_stream_id(private=True), private=True)
+kucoin_api.account = account
+
+# every order the bot placed, followed by clientOid through the private order topics
+order_tracker = OrderTracker()
 
 # Global dictionary to store user data, initialized with 3
 user_data = defaultdict(lambda: {"rr": 1.5,
@@ -37,70 +72,93 @@ user_data = defaultdict(lambda: {"rr": 1.5,
                                  "fee": 0.001,
                                  "fee_buffer": 0.00000001,
                                  "tp_type": 'ideal',
-                                 'Entry ID': None,
-                                 'Take Profit ID': None,
-                                 'Stop Loss ID': None
+                                 "max_staleness": 2,
+                                 "fill_timeout": 4
                                 })
 
-# store price monitoring tasks
-price_monitoring_tasks = {}
+# record every tick for backtesting and latency analysis
+TICK_STORE_DIR = os.getenv("TICK_STORE_DIR", "ticks")
+tick_writer = TickWriter(TICK_STORE_DIR, "kucoin", SYMBOL) if TICK_STORE_DIR else None
+
+def record_tick(tick):
+    tick_writer.append(tick.time * 1_000_000, tick.price, tick.size, tick.best_bid, tick.best_ask, tick.received)
+
+# /lastprice stream of each user
+price_streams = {}
+
+# every open position with its exit orders, evaluated once per tick
+position_book = PositionBook()
+
+# per-stage latency of the trading commands
+latency_stats = LatencyStats()
+
+# every price alert, evaluated once per tick
+alert_book = AlertBook()
+
+# periodic request keeping a pooled connection open for the pre-built exits
+warm_task = None
+
+# outgoing Telegram messages, queued without blocking and sent within the chat rate limits
+notifier = Notifier()
 
 # read dictionary values
 async def config(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        await update.message.reply_text("Unauthorized user.")
+        notifier.reply(update, "Unauthorized user.")
         return
 
     # get stored values 
     user_config = user_data[update.effective_user.id]
 
     if not user_config:
-        await update.message.reply_text("No variables set.")
+        notifier.reply(update, "No variables set.")
         return
 
     config_text = "\n".join([f"{key} = {value}" for key, value in user_config.items()])
-    await update.message.reply_text(f"Your configuration:\n{config_text}")
+    notifier.reply(update, f"Your configuration:\n{config_text}")
 
 # set value
 async def set_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        await update.message.reply_text("Unauthorized user.")
+        notifier.reply(update, "Unauthorized user.")
         return
 
     if len(context.args) != 2:
-        await update.message.reply_text("Usage: /write <variable_name> <value>")
+        notifier.reply(update, "Usage: /write <variable_name> <value>")
         return
 
     variable_name, variable_value = context.args[0], context.args[1]
 
     # Set or update the variable in user_data
     user_data[update.effective_user.id][variable_name] = float(variable_value)
-    await update.message.reply_text(f"Set {variable_name} = {variable_value}")
+    notifier.reply(update, f"Set {variable_name} = {variable_value}")
 
 # get value
 async def get_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        await update.message.reply_text("Unauthorized user.")
+        notifier.reply(update, "Unauthorized user.")
         return
 
     if len(context.args) != 1:
-        await update.message.reply_text("Usage: /read <variable_name>")
+        notifier.reply(update, "Usage: /read <variable_name>")
         return
 
     variable_name = context.args[0]
 
     # Retrieve variable or return "not set"
     value = user_data[update.effective_user.id].get(variable_name, "Not set")
-    await update.message.reply_text(f"{variable_name} = {value}")
+    notifier.reply(update, f"{variable_name} = {value}")
 
 # Enter a long trade
 async def buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        await update.message.reply_text("Unauthorized user.")
+        notifier.reply(update, "Unauthorized user.")
         return
 
+    trace = latency_stats.trace('buy', update.message.date)
+
     # extract stop loss from message
     SL = float(context.args[0])
 
@@ -111,97 +169,135 @@ async def buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
     tptype = user_data[update.effective_user.id].get('tp_type', "Not set")
 
     # Price position size and take profit
-    pricer_res = kucoin_api.pricer(side="buy", stopLoss=SL, RR=RR, Risk=Risk, f=f, tp_type=tptype)
+    max_staleness = user_data[update.effective_user.id].get('max_staleness', None)
+    pricer_res = await kucoin_api.pricer(side="buy", stopLoss=SL, RR=RR, Risk=Risk, f=f, tp_type=tptype, max_staleness=max_staleness, symbol=SYMBOL)
+    trace.mark('pricer')
     if pricer_res is None:
-        await update.message.reply_text("Pricer empty, didn't execute")
+        notifier.reply(update, "Pricer empty, didn't execute")
         return
         
+    rules = symbols[SYMBOL]
     n = pricer_res['size']
     V = pricer_res['funds']
     P = pricer_res['price']
     TP = pricer_res['takeProfit']
     M = pricer_res['balanceBefore']
-    await update.message.reply_text(f"Balance before trade: {M}")
+    notifier.reply(update, f"Balance before trade: {M}")
+    trace.mark('notify')
 
-    # enter
+    # enter, the fill comes from the private order stream
+    entryOid, stopLossOid, takeProfitOid = (uuid.uuid4().hex for _ in range(3))
+    timeout = user_data[update.effective_user.id].get('fill_timeout', 4)
+    order_tracker.track(entryOid)
     if float(M) < float(V) * (1+f):
-        entryId = kucoin_api.place_order_v3(side='buy', funds=f"{V:.6f}", auto_borrow=True)['data']['orderId']
-        time.sleep(4)
-        n = float(kucoin_api.get_order_info(entryId)['data']['dealSize'])
+        entryId = (await kucoin_api.place_order_v3(symbol=SYMBOL, side='buy', funds=rules.format_funds(V), auto_borrow=True, client_oid=entryOid))['data']['orderId']
+        trace.mark('entry_ack')
+        n = await filled_size(entryOid, entryId, timeout)
+        trace.mark('fill_confirm')
+        stopLossId = takeProfitId = None
         leveraged=True
     else:
-        entryId = kucoin_api.place_order_v1(side='buy', size=f"{n:.8f}")['data']['orderId'] # entry without leverage
-        time.sleep(1)
-        stopLossId = kucoin_api.stop_order_v1(side='sell', size=f"{n:.8f}", stop='loss', stopPrice=f"{SL:.8f}")['data']['orderId']
-        user_data[update.effective_user.id]['Stop Loss ID'] = stopLossId # save ID
-        time.sleep(1)
-        takeProfitId = kucoin_api.stop_order_v1(side='sell', size=f"{n:.8f}", stop='entry', stopPrice=f"{TP:.8f}")['data']['orderId'] # take profit
-        user_data[update.effective_user.id]['Take Profit ID'] = takeProfitId # save ID
+        entryId = (await kucoin_api.place_order_v1(symbol=SYMBOL, side='buy', size=rules.format_size(n), client_oid=entryOid))['data']['orderId'] # entry without leverage
+        trace.mark('entry_ack')
+        n = await filled_size(entryOid, entryId, timeout)
+        trace.mark('fill_confirm')
+        if n > 0:
+            stopLossId = await place_exit(stopLossOid, side='sell', size=rules.format_size(n), stop='loss', stopPrice=rules.format_price(SL))
+            trace.mark('stop_ack')
+            takeProfitId = await place_exit(takeProfitOid, side='sell', size=rules.format_size(n), stop='entry', stopPrice=rules.format_price(TP)) # take profit
+            trace.mark('tp_ack')
         leveraged = False
 
-    await update.message.reply_text(f"Bought {n} BTC at {round(P,0)} \n Stop Loss at {round(SL,0)} \n Take Profit at {round(TP,0)}") # send message
-    user_data[update.effective_user.id]['Entry ID'] = entryId # save ID
+    if n == 0:
+        notifier.reply(update, "Entry not filled, no position opened")
+        return
 
-    # Start price monitoring task
-    task = asyncio.create_task(process_buy(
-        update, TP, SL, n, update.effective_user.id, leveraged
-    ))
-    price_monitoring_tasks[update.effective_user.id] = task
+    # leveraged entries are protected by the monitor from here on
+    trace.finish('protected')
 
-    await update.message.reply_text("Monitoring price updates.")
+    notifier.reply(update, f"Bought {n} BTC at {round(P,0)} \n Stop Loss at {round(SL,0)} \n Take Profit at {round(TP,0)}") # send message
+
+    # leveraged positions are monitored from the shared ticker feed, the others close on their stop orders' fills
+    # a leveraged exit is built and serialized now, the tick that hits TP or SL only signs and sends it
+    exit_order = kucoin_api.arm_order_v3(symbol=SYMBOL, side='sell', size=rules.format_size(n)) if leveraged else None
+    position = position_book.open(update.effective_user.id, SYMBOL, 'buy', n, P, TP, SL, leveraged=leveraged, entry_id=entryId,
+                                  take_profit_id=takeProfitId, stop_loss_id=stopLossId, exit_order=exit_order, watched=leveraged, payload=update)
+    if not leveraged:
+        watch_exits(position, takeProfitOid, stopLossOid)
+
+    notifier.reply(update, f"Monitoring position {position.id}.")
    
 
-# price monitoring task
-async def process_buy(update, TP, SL, n, user_id, leveraged):
+# filled size of an entry from the private order stream, from REST only when no fill event arrives in time
+async def filled_size(client_oid, order_id, timeout):
+    order_tracker.bind(client_oid, order_id)
     try:
-        async with websockets.connect(WS_URL) as websocket:
-            await websocket.send(json.dumps({
-                "id": int(os.getenv('KUCOIN_STREAMING_ID',"")),
-                "type": "subscribe",
-                "topic": "/market/ticker:BTC-USDT",
-                "response": True
-            }))
-
-            while True:
-                data = json.loads(await websocket.recv())
-                if "data" in data:
-                    price = float(data['data']['price'])
-        
-                    if price >= TP:
-                        if leveraged:
-                            kucoin_api.place_order_v3(side='sell', size =f"{n:.8f}")
-                            await update.message.reply_text(f"Price hit take profit \n Please 'close all' manually!")
-                        else:
-                            await update.message.reply_text(f"Price hit take profit.")
-                            stopLossId = user_data[update.effective_user.id].get('Stop Loss ID', "Not set")
-                            kucoin_api.cancel_order(stopLossId)
-                            user_data[user_id]['Stop Loss ID'] = None
-                            user_data[user_id]['Take Profit ID'] = None
-                    
-                        break
-                    
-                    elif price <= SL:
-                        if leveraged:
-                            kucoin_api.place_order_v3(side='sell', size =f"{n:.8f}")
-                            await update.message.reply_text(f"Price hit stop loss \n Please 'close all' manually!")
-                        else:
-                            await update.message.reply_text(f"Price hit stop loss.")
-                            takeProfitId = user_data[update.effective_user.id].get('Take Profit ID', "Not set")
-                            kucoin_api.cancel_order(takeProfitId)
-                            user_data[user_id]['Take Profit ID'] = None
-                            user_data[user_id]['Stop Loss ID'] = None
-
-                        break
+        return (await order_tracker.wait(client_oid, timeout)).filled_size
+    except asyncio.TimeoutError:
+        logging.warning(f"No fill event for {order_id} after {timeout}s, polling the order")
+        return float((await kucoin_api.get_order_info(order_id, symbol=SYMBOL))['data']['dealSize'])
     finally:
-        price_monitoring_tasks.pop(user_id, None)
+        order_tracker.forget(client_oid)
+
+# stop order tracked before it is placed, so a trigger during the request is not missed
+async def place_exit(client_oid, **order):
+    order_tracker.track(client_oid)
+    order_id = (await kucoin_api.stop_order_v1(symbol=SYMBOL, client_oid=client_oid, **order))['data']['orderId']
+    order_tracker.bind(client_oid, order_id)
+    return order_id
+
+def watch_exits(position, take_profit_oid, stop_loss_oid):
+    order_tracker.on(take_profit_oid, lambda order: exit_filled(position, order, TAKE_PROFIT))
+    order_tracker.on(stop_loss_oid, lambda order: exit_filled(position, order, STOP_LOSS))
+
+# order tracker callback, only a real fill of an exit order closes the position
+def exit_filled(position, order, hit):
+    if order.state != FILLED or position_book.remove(position.id) is None:
+        return
+    forget_exits(position)
+    asyncio.create_task(exit_position(position, hit))
+
+# stop following the exit orders of a position that is no longer monitored
+def forget_exits(position):
+    order_tracker.forget(*(order_tracker.order_ids.get(order_id) for order_id in (position.take_profit_id, position.stop_loss_id) if order_id))
+
+# position book tick callback, handles every position whose exit level was reached
+def process_positions(tick):
+    for position, hit in position_book.on_price(tick.price):
+        asyncio.create_task(exit_position(position, hit))
+
+async def exit_position(position, hit):
+    update = position.payload
+    action = exit_action(hit, position.leveraged)
+    if action == MARKET_EXIT:
+        if position.exit_order is not None:
+            await kucoin_api.fire(position.exit_order)
+        else:
+            await kucoin_api.place_order_v3(symbol=position.symbol, side=exit_side(position.side), size=symbols[position.symbol].format_size(position.size))
+        notifier.reply(update, f"Position {position.id}: price hit {LABELS[hit]} \n Please 'close all' manually!")
+    elif position.side == 'buy':
+        notifier.reply(update, f"Position {position.id}: price hit {LABELS[hit]}.")
+        await cancel_other_leg(position, action)
+    else:
+        notifier.reply(update, f"Position {position.id}: price hit {LABELS[hit]} \n Please 'close all' manually!")
+        await cancel_other_leg(position, action)
+
+# cancel the exit order that did not fill and clear both saved IDs
+async def cancel_other_leg(position, action):
+    order_id = position.stop_loss_id if action == CANCEL_STOP_LOSS else position.take_profit_id
+    if order_id is not None:
+        await kucoin_api.cancel_order(order_id)
+    position.stop_loss_id = position.take_profit_id = None
 
 # Enter a short trade
 async def sell(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        await update.message.reply_text("Unauthorized user.")
+        notifier.reply(update, "Unauthorized user.")
         return
 
+    trace = latency_stats.trace('sell', update.message.date)
+
     # extract stop loss from message
     SL = float(context.args[0])
 
@@ -213,227 +309,233 @@ async def sell(update: Update, context: ContextTypes.DEFAULT_TYPE):
     tptype = user_data[update.effective_user.id].get('tp_type', "Not set")
 
     # Price position size and take profit
-    pricer_res = kucoin_api.pricer(side="sell", stopLoss=SL, RR=RR, Risk=Risk, f=f, tp_type=tptype)
+    max_staleness = user_data[update.effective_user.id].get('max_staleness', None)
+    pricer_res = await kucoin_api.pricer(side="sell", stopLoss=SL, RR=RR, Risk=Risk, f=f, tp_type=tptype, max_staleness=max_staleness, symbol=SYMBOL)
+    trace.mark('pricer')
     if pricer_res is None:
-        await update.message.reply_text("Pricer empty, didn't execute")
+        notifier.reply(update, "Pricer empty, didn't execute")
         return
     
+    rules = symbols[SYMBOL]
     n = pricer_res['size']
     V = pricer_res['funds']
     P = pricer_res['price']
     TP = pricer_res['takeProfit']
     M = pricer_res['balanceBefore']
-    await update.message.reply_text(f"Balance before trade: {M}")
-
-    # enter
-    entryId = kucoin_api.place_order_v3(side='sell', size=f"{n:.8f}")['data']['orderId'] # entry
-    time.sleep(2)
-    takeProfitId = kucoin_api.stop_order_v1(stopPrice=f"{TP:.8f}", stop='loss', side='buy', size=f"{n+fee_buffer:.8f}")['data']['orderId'] # take profit
-    time.sleep(2)
-    stopLossId = kucoin_api.stop_order_v1(stopPrice=f"{SL:.8f}", stop='entry', side='buy', size=f"{n+fee_buffer:.8f}")['data']['orderId'] # stop loss
-    time.sleep(2)
-
-    user_data[update.effective_user.id]['Entry ID'] = entryId # save ID
-    user_data[update.effective_user.id]['Stop Loss ID'] = stopLossId # save ID
-    user_data[update.effective_user.id]['Take Profit ID'] = takeProfitId # save ID
-        
-    await update.message.reply_text(f"Sold {n} BTC at {round(P,0)} \n Stop Loss at {round(SL,0)} \n Take Profit at {round(TP,0)}") # send message
-    user_data[update.effective_user.id]['Entry ID'] = entryId # save ID
+    notifier.reply(update, f"Balance before trade: {M}")
+    trace.mark('notify')
+
+    # enter, the fill comes from the private order stream
+    entryOid, stopLossOid, takeProfitOid = (uuid.uuid4().hex for _ in range(3))
+    timeout = user_data[update.effective_user.id].get('fill_timeout', 4)
+    order_tracker.track(entryOid)
+    entryId = (await kucoin_api.place_order_v3(symbol=SYMBOL, side='sell', size=rules.format_size(n), client_oid=entryOid))['data']['orderId'] # entry
+    trace.mark('entry_ack')
+    n = await filled_size(entryOid, entryId, timeout)
+    trace.mark('fill_confirm')
+    if n == 0:
+        notifier.reply(update, "Entry not filled, no position opened")
+        return
+    takeProfitId = await place_exit(takeProfitOid, stopPrice=rules.format_price(TP), stop='loss', side='buy', size=rules.format_size(n+fee_buffer)) # take profit
+    trace.mark('tp_ack')
+    stopLossId = await place_exit(stopLossOid, stopPrice=rules.format_price(SL), stop='entry', side='buy', size=rules.format_size(n+fee_buffer)) # stop loss
+    trace.mark('stop_ack')
+    trace.finish('protected')
+
+    notifier.reply(update, f"Sold {n} BTC at {round(P,0)} \n Stop Loss at {round(SL,0)} \n Take Profit at {round(TP,0)}") # send message
 
-    # Start price monitoring task
-    task = asyncio.create_task(process_sell(
-        update, TP, SL, update.effective_user.id
-    ))
-    price_monitoring_tasks[update.effective_user.id] = task
+    # closed by the fills of its stop orders
+    position = position_book.open(update.effective_user.id, SYMBOL, 'sell', n, P, TP, SL, entry_id=entryId,
+                                  take_profit_id=takeProfitId, stop_loss_id=stopLossId, watched=False, payload=update)
+    watch_exits(position, takeProfitOid, stopLossOid)
 
-    await update.message.reply_text("Monitoring price updates.")
+    notifier.reply(update, f"Monitoring position {position.id}.")
 
 
 
 async def alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        await update.message.reply_text("Unauthorized user.")
+        notifier.reply(update, "Unauthorized user.")
         return
     
-    # Get target price from command argument
-    target = float(context.args[0])
+    if len(context.args) == 0:
+        notifier.reply(update, "Usage: /alert <price> [<price> ...]")
+        return
+
+    # Get target prices from command arguments
+    targets = [float(arg) for arg in context.args]
     
-    # Start monitoring task
-    task = asyncio.create_task(process_alert(update, target, update.effective_user.id))
-    price_monitoring_tasks[update.effective_user.id] = task
+    # Add every target to the shared alert book
+    for target in targets:
+        alert_book.add(target, owner=update.effective_user.id, payload=update)
     
-    await update.message.reply_text(f"Monitoring for price crossing ${target}")
-
-async def process_alert(update, target, user_id):
-    try:
-        async with websockets.connect(WS_URL) as websocket:
-            await websocket.send(json.dumps({
-                "id": int(os.getenv('KUCOIN_STREAMING_ID',"")),
-                "type": "subscribe",
-                "topic": "/market/ticker:BTC-USDT",
-                "response": True
-            }))
- 
-            last_price = None
-            while True:
-                data = json.loads(await websocket.recv())
-                if "data" in data:
-                    current_price = float(data['data']['price'])
-                    
-                    if last_price is not None:
-                        # Check for crossing above target
-                        if last_price < target and current_price >= target:
-                            await update.message.reply_text(f"Price crossed above ${target}!")
-                            break
-                        # Check for crossing below target
-                        elif last_price > target and current_price <= target:
-                            await update.message.reply_text(f"Price dropped below ${target}!")
-                            break
-                    
-                    last_price = current_price
-
-    finally:
-        price_monitoring_tasks.pop(user_id, None)
-
-
-# price monitoring task
-async def process_sell(update, TP, SL, user_id):
-    try:
-        async with websockets.connect(WS_URL) as websocket:
-            await websocket.send(json.dumps({
-                "id": int(os.getenv('KUCOIN_STREAMING_ID',"")),
-                "type": "subscribe",
-                "topic": "/market/ticker:BTC-USDT",
-                "response": True
-            }))
-
-            while True:
-                data = json.loads(await websocket.recv())
-                if "data" in data:
-                    price = float(data['data']['price'])
-
-                    takeProfitId = user_data[update.effective_user.id].get('Take Profit ID', "Not set")
-                    stopLossId = user_data[update.effective_user.id].get('Stop Loss ID', "Not set")
-        
-                    if price <= TP:
-                        await update.message.reply_text(f"Price hit take profit \n Please 'close all' manually!")
-                        kucoin_api.cancel_order(stopLossId)
-                        user_data[update.effective_user.id]['Stop Loss ID'] = None
-                        user_data[update.effective_user.id]['Take Profit ID'] = None
-                        break
-                    elif price >= SL:
-                        await update.message.reply_text(f"Price hit stop loss \n Please 'close all' manually!")
-                        kucoin_api.cancel_order(takeProfitId)
-                        user_data[update.effective_user.id]['Take Profit ID'] = None
-                        user_data[update.effective_user.id]['Stop Loss ID'] = None
-                    break
-    finally:
-        price_monitoring_tasks.pop(user_id, None)
+    levels = ", ".join(f"${target}" for target in targets)
+    notifier.reply(update, f"Monitoring for price crossing {levels}")
 
+# alert book tick callback, fires every level crossed since the previous tick
+def process_alerts(tick):
+    for fired in alert_book.on_price(tick.price):
+        if fired.direction == 'up':
+            text = f"Price crossed above ${fired.level}!"
+        else:
+            text = f"Price dropped below ${fired.level}!"
+        notifier.reply(fired.payload, text)
 
 
 async def kill(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    # Cancel price monitoring task if exists
-    if update.effective_user.id in price_monitoring_tasks:
-        price_monitoring_tasks[update.effective_user.id].cancel()
-        price_monitoring_tasks.pop(update.effective_user.id)
-        await update.message.reply_text("Stopped monitoring price.")
+    # Stop monitoring positions, their exchange orders stay in place
+    removed = position_book.remove_owner(update.effective_user.id)
+    for position in removed:
+        forget_exits(position)
+    if removed:
+        notifier.reply(update, f"Stopped monitoring {len(removed)} positions.")
+
+    # Cancel the price stream if one is running
+    if stop_price_stream(update.effective_user.id):
+        notifier.reply(update, "Stopped price stream.")
+
+    # Remove price alerts
+    removed = alert_book.remove_owner(update.effective_user.id)
+    if removed:
+        notifier.reply(update, f"Removed {len(removed)} price alerts.")
 
 # kill all active positions, repay debt / sell btc
 async def close(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        await update.message.reply_text("Unauthorized user.")
+        notifier.reply(update, "Unauthorized user.")
         return
     
-    stopLossId = user_data[update.effective_user.id].get('Stop Loss ID', "Not set")
-    takeProfitId = user_data[update.effective_user.id].get('Take Profit ID', "Not set")
-
-    if takeProfitId is not None:
-        kucoin_api.cancel_order(takeProfitId)
-        await update.message.reply_text("Cancelled take profit.")
-
+    # cancel the exit orders of every open position
+    for position in position_book.remove_owner(update.effective_user.id):
+        forget_exits(position)
+        if position.take_profit_id is not None:
+            await kucoin_api.cancel_order(position.take_profit_id)
+            notifier.reply(update, f"Cancelled take profit of position {position.id}.")
+
+        if position.stop_loss_id is not None:
+            await kucoin_api.cancel_order(position.stop_loss_id)
+            notifier.reply(update, f"Cancelled stop loss of position {position.id}.")
     
-    if stopLossId is not None:
-        kucoin_api.cancel_order(stopLossId)
-        await update.message.reply_text("Cancelled stop loss.")
-    
-    BTC_assets = kucoin_api.get_account_info(quoteCurrency="BTC")['data']['assets'][0]['baseAsset']['available']
-    BTC_liability = kucoin_api.get_account_info(quoteCurrency="BTC")['data']['assets'][0]['baseAsset']['liability']
+    # rounded down to the lot size, dust below one step cannot be traded
+    rules = symbols[SYMBOL]
+    BTC_assets = rules.format_size(account.base.available)
+    # rounded up, a liability rounded down to the lot step leaves dust debt accruing interest
+    BTC_liability = rules.format_size_up(account.base.liability)
 
     if float(BTC_liability) > 0:
-        kucoin_api.place_order_v1(side='buy', size=BTC_liability)
-        await update.message.reply_text(f"Bought {BTC_liability} BTC.")
+        await kucoin_api.place_order_v1(symbol=SYMBOL, side='buy', size=BTC_liability)
+        notifier.reply(update, f"Bought {BTC_liability} BTC.")
 
     if float(BTC_assets) > 0:
-        kucoin_api.place_order_v1(side='sell', size=BTC_assets)
-        await update.message.reply_text(f"Sold {BTC_assets} BTC.")
+        await kucoin_api.place_order_v1(symbol=SYMBOL, side='sell', size=BTC_assets)
+        notifier.reply(update, f"Sold {BTC_assets} BTC.")
 
 
 async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        await update.message.reply_text("Unauthorized user.")
+        notifier.reply(update, "Unauthorized user.")
         return
     
-    account_info = kucoin_api.get_account_info(quoteCurrency="BTC")
-
-    BTC_balance = account_info['data']['assets'][0]['baseAsset']
-    await update.message.reply_text(f"BTC Balance:\n {BTC_balance}")
+    BTC_balance = account.base.as_dict()
+    notifier.reply(update, f"BTC Balance:\n {BTC_balance}")
 
-    USDT_balance = account_info['data']['assets'][0]['quoteAsset']
-    await update.message.reply_text(f"USDT Balance:\n {USDT_balance}")
+    USDT_balance = account.quote.as_dict()
+    notifier.reply(update, f"USDT Balance:\n {USDT_balance}")
 
 # stop listening for price updates
 async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global listening
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        await update.message.reply_text("Unauthorized user.")
+        notifier.reply(update, "Unauthorized user.")
         return
 
-    listening = False
-    await update.message.reply_text("Stopped listening.")
+    stop_price_stream(update.effective_user.id)
+    notifier.reply(update, "Stopped listening.")
+
+def stop_price_stream(user_id):
+    task = price_streams.pop(user_id, None)
+    if task is None:
+        return False
+    task.cancel()
+    return True
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != AUTHORIZED_USER_ID:
+        notifier.reply(update, "Unauthorized user.")
+        return
+
+    notifier.reply(update, latency_stats.report())
 
 async def lastprice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != AUTHORIZED_USER_ID:
-        await update.message.reply_text("Unauthorized user.")
+        notifier.reply(update, "Unauthorized user.")
         return
     
-    # Start price monitoring task
+    # Start price monitoring task, replacing a stream already running for this user
+    stop_price_stream(update.effective_user.id)
     task = asyncio.create_task(process_lastprice(update, update.effective_user.id))
-    price_monitoring_tasks[update.effective_user.id] = task
+    price_streams[update.effective_user.id] = task
     
-    await update.message.reply_text("Starting price stream...")
+    notifier.reply(update, "Starting price stream...")
 
 
 async def process_lastprice(update, user_id):
     try:
-        async with websockets.connect(WS_URL) as websocket:
-            await websocket.send(json.dumps({
-                "id": int(os.getenv('KUCOIN_STREAMING_ID',"")),
-                "type": "subscribe",
-                "topic": "/market/ticker:BTC-USDT",
-                "response": True
-            }))
-
+        with ticker_feed.subscribe(TICKER_TOPIC) as ticks:
             last_price = None
-            while True:
-                data = json.loads(await websocket.recv())
-                if "data" in data:
-                    current_price = float(data['data']['price'])
+            async for tick in ticks:
+                current_price = tick.price
                     
-                    # Only send message if price changed
-                    if last_price != current_price:
-                        await update.message.reply_text(f"BTC Price: ${round(current_price,1)}")
-                        last_price = current_price
+                # Only send message if price changed, an unsent price is replaced by the newer one
+                if last_price != current_price:
+                    notifier.reply(update, f"BTC Price: ${round(current_price,1)}", key="lastprice")
+                    last_price = current_price
 
     finally:
-        price_monitoring_tasks.pop(user_id, None)
+        if price_streams.get(user_id) is asyncio.current_task():
+            price_streams.pop(user_id)
 
 # Add to main()
 
+# keep the price and account caches streaming for the lifetime of the bot
+async def startup(application):
+    notifier.start(application.bot)
+
+    # the feeds fetch their own tokens and connect while the snapshots load
+    ticker_feed.listen(TICKER_TOPIC, price_cache.update)
+    ticker_feed.listen(TICKER_TOPIC, process_alerts)
+    ticker_feed.listen(TICKER_TOPIC, process_positions)
+    ticker_feed.listen(LEVEL2_TOPIC, order_book.update) # the first diff triggers the snapshot
+    if tick_writer is not None:
+        ticker_feed.listen(TICKER_TOPIC, record_tick)
+    global warm_task
+    warm_task = asyncio.create_task(kucoin_api.keep_warm())
+    account_feed.listen(account.topic, account.update)
+    account_feed.listen(ORDER_TOPIC, order_tracker.update)
+    account_feed.listen(ADVANCED_TOPIC, order_tracker.update_advanced)
+
+    # nothing touches the network at import, every startup request goes out at once here
+    await asyncio.gather(
+        retry(lambda: kucoin_api.get_account_info(symbol=SYMBOL, quoteCurrency=SYMBOL.split("-")[1]), account.load),
+        retry(symbols.start)
+    )
+
+# release the feeds and pooled Kucoin connections on shutdown
+async def shutdown(application):
+    symbols.stop()
+    if warm_task is not None:
+        warm_task.cancel()
+    ticker_feed.close()
+    order_book.close()
+    account_feed.close()
+    await kucoin_api.close()
+    if tick_writer is not None:
+        tick_writer.close()
+    await notifier.stop()
+
 # initialise Telegram bot
-app = ApplicationBuilder().token(BOT_TOKEN).build()
+app = ApplicationBuilder().token(BOT_TOKEN).post_init(startup).post_shutdown(shutdown).build()
 
 # add handlers
 app.add_handler(CommandHandler("config", config))
@@ -447,6 +549,7 @@ app.add_handler(CommandHandler('balance', balance))
 app.add_handler(CommandHandler('alert', alert))
 app.add_handler(CommandHandler("lastprice", lastprice))
 app.add_handler(CommandHandler("close", close))
+app.add_handler(CommandHandler("stats", stats))
 
 async def error_handler(update, context):
     if isinstance(context.error, NetworkError):
@@ -456,6 +559,5 @@ async def error_handler(update, context):
 
 app.add_error_handler(error_handler)
 
-#app.run_polling()
-
-app.run_polling(drop_pending_updates=True)
+if __name__ == "__main__":
+    app.run_polling(drop_pending_updates=True)
@@ -0,0 +1,159 @@
+# libraries
+import asyncio
+import logging
+import time
+
+# private topics pushing order changes, regular orders and stop orders
+ORDER_TOPIC = "/spotMarket/tradeOrdersV2"
+ADVANCED_TOPIC = "/spotMarket/advancedOrders"
+
+# order states
+NEW = 'new'
+PARTIALLY_FILLED = 'partially_filled'
+FILLED = 'filled'
+CANCELLED = 'cancelled'
+
+
+# One order followed by clientOid from placement to filled or cancelled
+class OrderState:
+    __slots__ = ('client_oid', 'order_id', 'state', 'triggered', 'size', 'filled_size', 'filled_funds', 'updated')
+
+    def __init__(self, client_oid):
+        self.client_oid = client_oid
+        self.order_id = None
+        self.state = NEW
+        self.triggered = False # stop orders, the stop price was reached and the order sent to the book
+        self.size = None
+        self.filled_size = 0.0
+        self.filled_funds = 0.0
+        self.updated = time.monotonic()
+
+    @property
+    def done(self):
+        return self.state in (FILLED, CANCELLED)
+
+    @property
+    def average_price(self):
+        return self.filled_funds / self.filled_size if self.filled_size else None
+
+    def __repr__(self):
+        return f"OrderState({self.client_oid} {self.state} {self.filled_size}/{self.size})"
+
+
+# Order state machine fed by the private order topics
+class OrderTracker:
+
+    def __init__(self):
+        """
+        Orders are tracked before they are placed, so a fill pushed ahead of the REST ack is not lost.
+        Events of untracked orders are ignored. Callbacks run on the event loop on every state change.
+        """
+        self.orders = {} # clientOid -> OrderState
+        self.order_ids = {} # orderId -> clientOid, stop order events may only carry the orderId
+        self.callbacks = {} # clientOid -> callback(OrderState)
+        self.waiters = {} # clientOid -> [future]
+
+    def track(self, client_oid):
+        order = self.orders.get(client_oid)
+        if order is None:
+            order = self.orders[client_oid] = OrderState(client_oid)
+        return order
+
+    # orderId from the REST ack
+    def bind(self, client_oid, order_id):
+        if client_oid in self.orders and order_id:
+            self.orders[client_oid].order_id = order_id
+            self.order_ids[order_id] = client_oid
+
+    def on(self, client_oid, callback):
+        order = self.track(client_oid)
+        self.callbacks[client_oid] = callback
+        # the order may have moved while it was being placed
+        if order.state != NEW:
+            self._notify(order)
+
+    def forget(self, *client_oids):
+        for client_oid in client_oids:
+            order = self.orders.pop(client_oid, None)
+            if order is not None and order.order_id is not None:
+                self.order_ids.pop(order.order_id, None)
+            self.callbacks.pop(client_oid, None)
+            for future in self.waiters.pop(client_oid, []):
+                future.cancel()
+
+    async def wait(self, client_oid, timeout=None):
+        """
+        Returns the OrderState once it is filled or cancelled, raises asyncio.TimeoutError after timeout seconds.
+        """
+        order = self.track(client_oid)
+        if order.done:
+            return order
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(client_oid, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            waiters = self.waiters.get(client_oid)
+            if waiters and future in waiters:
+                waiters.remove(future)
+
+    # ============ Stream callbacks ============
+
+    def _lookup(self, data):
+        client_oid = data.get('clientOid') or self.order_ids.get(data.get('orderId'))
+        return self.orders.get(client_oid)
+
+    # private stream callback, message data of the trade orders topic
+    def update(self, data):
+        order = self._lookup(data)
+        if order is None or order.done:
+            return
+        if order.order_id is None and data.get('orderId'):
+            self.bind(order.client_oid, data['orderId'])
+
+        kind = data.get('type')
+        if data.get('size'):
+            order.size = float(data['size'])
+        if kind == 'match':
+            size = float(data['matchSize'])
+            order.filled_funds += size * float(data['matchPrice'])
+            order.filled_size = float(data['filledSize']) if data.get('filledSize') else order.filled_size + size
+            order.state = PARTIALLY_FILLED
+        elif kind == 'filled':
+            if data.get('filledSize'):
+                order.filled_size = float(data['filledSize'])
+            order.state = FILLED
+        elif kind == 'canceled':
+            order.state = CANCELLED
+        elif kind not in ('received', 'open', 'update'):
+            return
+        order.updated = time.monotonic()
+        self._notify(order)
+
+    # private stream callback, message data of the stop orders topic
+    def update_advanced(self, data):
+        order = self._lookup(data)
+        if order is None or order.done:
+            return
+        kind = data.get('type')
+        if kind == 'triggered':
+            order.triggered = True
+        elif kind == 'cancel':
+            order.state = CANCELLED
+        else:
+            return
+        order.updated = time.monotonic()
+        self._notify(order)
+
+    def _notify(self, order):
+        if order.done:
+            for future in self.waiters.pop(order.client_oid, []):
+                if not future.done():
+                    future.set_result(order)
+
+        callback = self.callbacks.get(order.client_oid)
+        if callback is not None:
+            try:
+                callback(order)
+            except Exception:
+                logging.exception(f"Order callback failed for {order.client_oid}")
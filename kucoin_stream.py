@@ -0,0 +1,287 @@
+# libraries
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import deque
+
+import websockets
+
+# topic prefix of the public ticker channel
+TICKER_PREFIX = "/market/ticker:"
+
+
+# websocket URL of a bullet-public or bullet-private response
+def bullet_url(response):
+    bullet = response['data']
+    return f"{bullet['instanceServers'][0]['endpoint']}?token={bullet['token']}"
+
+
+# Ticker update, decoded once and shared by every subscriber
+class Tick:
+    __slots__ = ('symbol', 'price', 'size', 'best_bid', 'best_ask', 'sequence', 'time', 'received')
+
+    def __init__(self, symbol, price, size, best_bid, best_ask, sequence, time, received):
+        self.symbol = symbol
+        self.price = price
+        self.size = size
+        self.best_bid = best_bid
+        self.best_ask = best_ask
+        self.sequence = sequence
+        self.time = time
+        self.received = received
+
+    @classmethod
+    def from_kucoin(cls, topic, data):
+        return cls(
+            topic[len(TICKER_PREFIX):],
+            float(data['price']),
+            float(data['size']),
+            float(data['bestBid']),
+            float(data['bestAsk']),
+            int(data['sequence']),
+            int(data['time']),
+            time.time_ns()
+        )
+
+    def __repr__(self):
+        return f"Tick({self.symbol} {self.price} bid={self.best_bid} ask={self.best_ask})"
+
+
+# Bounded per-subscriber queue
+class Subscription:
+
+    def __init__(self, stream, topic, maxsize=1, policy='latest'):
+        """
+        policy 'latest' keeps only the most recent value, 'drop_oldest' keeps up to
+        maxsize values and discards the oldest one when a new value arrives on a full queue.
+        """
+        if policy not in ('latest', 'drop_oldest'):
+            raise ValueError("policy must be 'latest' or 'drop_oldest'")
+
+        self.stream = stream
+        self.topic = topic
+        self.policy = policy
+        self.queue = deque(maxlen=1 if policy == 'latest' else maxsize)
+        self.dropped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def push(self, item):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(item)
+        self._ready.set()
+
+    async def get(self):
+        while not self.queue:
+            if self.closed:
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+        return self.queue.popleft()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._ready.set()
+            self.stream.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Synchronous callback fed straight from the stream, for caches that only keep the last value
+class Listener:
+
+    def __init__(self, stream, topic, callback):
+        self.stream = stream
+        self.topic = topic
+        self.push = callback
+        self.closed = False
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.stream.unsubscribe(self)
+
+
+# One websocket connection multiplexing any number of topics and subscribers
+class KucoinStream:
+
+    def __init__(self, url=None, ping_interval=18, private=False, token=None, gap_fill=None, max_backoff=30):
+        """
+        Supervised connection: every (re)connect fetches a fresh bullet from token() when it is given,
+        pings at the server's pingInterval, resubscribes every topic and, after a drop, pushes a REST
+        snapshot from gap_fill(symbol) to each ticker topic so monitors see the current price at once.
+        The first reconnect is immediate, repeated failures back off exponentially with full jitter.
+        """
+        self.url = url
+        self.private = private
+        self.ping_interval = ping_interval
+        self.token = token
+        self.gap_fill = gap_fill
+        self.max_backoff = max_backoff
+        self.subscribers = {}
+        self.websocket = None
+        self.reconnects = 0
+        self.downtime = None # seconds without a connection before the last reconnect
+        self._task = None
+        self._ids = itertools.count(1)
+
+    def subscribe(self, topic, maxsize=1, policy='latest'):
+        return self._add(Subscription(self, topic, maxsize, policy))
+
+    def listen(self, topic, callback):
+        return self._add(Listener(self, topic, callback))
+
+    def _add(self, sub):
+
+        subs = self.subscribers.setdefault(sub.topic, [])
+        subs.append(sub)
+
+        if len(subs) == 1 and self.websocket is not None:
+            asyncio.create_task(self._send_subscription(sub.topic, "subscribe"))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return sub
+
+    def unsubscribe(self, sub):
+
+        subs = self.subscribers.get(sub.topic, [])
+        if sub in subs:
+            subs.remove(sub)
+        if subs:
+            return
+
+        self.subscribers.pop(sub.topic, None)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+        elif self.websocket is not None:
+            asyncio.create_task(self._send_subscription(sub.topic, "unsubscribe"))
+
+    # drop the connection, every subscriber is woken up as closed
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _send_subscription(self, topic, action):
+        try:
+            await self.websocket.send(json.dumps({
+                "id": next(self._ids),
+                "type": action,
+                "topic": topic,
+                "privateChannel": self.private,
+                "response": True
+            }))
+        except (AttributeError, websockets.ConnectionClosed):
+            pass
+
+    async def _ping(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await self.websocket.send(json.dumps({"id": next(self._ids), "type": "ping"}))
+
+    def _dispatch(self, topic, data):
+
+        subs = self.subscribers.get(topic)
+        if not subs:
+            return
+
+        # decode once, every subscriber receives the same object
+        item = Tick.from_kucoin(topic, data) if topic.startswith(TICKER_PREFIX) else data
+        for sub in list(subs):
+            try:
+                sub.push(item)
+            except Exception:
+                logging.exception(f"Kucoin subscriber failed on {topic}")
+
+    # fresh token and the server's ping interval, tokens are only valid to connect once
+    async def _connect_url(self):
+        if self.token is None:
+            return self.url
+        response = await self.token()
+        server = response['data']['instanceServers'][0]
+        if server.get('pingInterval'):
+            self.ping_interval = server['pingInterval'] / 1000
+        self.url = bullet_url(response)
+        return self.url
+
+    # price during the outage is lost, push the current one from REST before the next streamed tick
+    async def _fill_gap(self):
+        topics = [topic for topic in self.subscribers if topic.startswith(TICKER_PREFIX)]
+        responses = await asyncio.gather(*(self.gap_fill(topic[len(TICKER_PREFIX):]) for topic in topics), return_exceptions=True)
+        for topic, response in zip(topics, responses):
+            if isinstance(response, dict) and response.get('data'):
+                self._dispatch(topic, response['data'])
+
+    async def _run(self):
+
+        attempt = 0
+        down_since = None
+        try:
+            while self.subscribers:
+                pinger = None
+                try:
+                    async with websockets.connect(await self._connect_url()) as websocket:
+                        self.websocket = websocket
+                        for topic in list(self.subscribers):
+                            await self._send_subscription(topic, "subscribe")
+                        pinger = asyncio.create_task(self._ping())
+
+                        if down_since is not None:
+                            if self.gap_fill is not None:
+                                await self._fill_gap()
+                            self.downtime = time.monotonic() - down_since
+                            logging.warning(f"Kucoin stream reconnected after {self.downtime * 1e3:.0f} ms")
+                        attempt = 0
+
+                        async for raw in websocket:
+                            # a malformed message is skipped, it says nothing about the connection
+                            try:
+                                msg = json.loads(raw)
+                                if msg.get('type') == 'message':
+                                    self._dispatch(msg['topic'], msg['data'])
+                            except (ValueError, KeyError, TypeError) as e:
+                                logging.error(f"Kucoin stream message skipped: {e}")
+
+                # anything short of cancellation reconnects: socket and protocol errors, a failed bullet request,
+                # or a bullet response that is not the expected JSON (an HTML 502 during an outage)
+                except Exception as e:
+                    logging.error(f"Kucoin stream closed: {type(e).__name__}: {e}")
+                finally:
+                    self.websocket = None
+                    if pinger is not None:
+                        pinger.cancel()
+
+                # the first retry is immediate, then exponential backoff with full jitter
+                if down_since is None or attempt == 0:
+                    down_since = time.monotonic()
+                self.reconnects += 1
+                if attempt:
+                    await asyncio.sleep(random.uniform(0, min(self.max_backoff, 0.25 * 2 ** attempt)))
+                attempt += 1
+
+        finally:
+            # reached on close() or cancellation, or once the last subscriber has left
+            self.websocket = None
+            # wake subscribers so monitors do not wait forever on a dead feed
+            for subs in list(self.subscribers.values()):
+                for sub in list(subs):
+                    sub.closed = True
+                    if isinstance(sub, Subscription):
+                        sub._ready.set()
+            self.subscribers.clear()
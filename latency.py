@@ -0,0 +1,67 @@
+# libraries
+import time
+from collections import deque
+
+
+# Rolling latency samples per stage, in seconds
+class LatencyStats:
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.samples = {}
+
+    def record(self, stage, seconds):
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def trace(self, name, received=None):
+        return Trace(self, name, received)
+
+    def summary(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            n = len(ordered)
+            result[stage] = {
+                'count': n,
+                'p50': ordered[(n - 1) // 2],
+                'p99': ordered[min(n - 1, int(n * 0.99))],
+                'max': ordered[-1]
+            }
+        return result
+
+    def report(self):
+        summary = self.summary()
+        if not summary:
+            return "No latency samples yet."
+        lines = [f"{'stage':<24}{'n':>6}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for stage, s in summary.items():
+            lines.append(f"{stage:<24}{s['count']:>6}{s['p50']*1e3:>10.1f}{s['p99']*1e3:>10.1f}{s['max']*1e3:>10.1f}")
+        return "\n".join(lines)
+
+
+# High-resolution stage timestamps of one command, from receipt to protection
+class Trace:
+
+    def __init__(self, stats, name, received=None):
+        """
+        received is the Telegram message datetime, its delivery lag is recorded as the first stage.
+        Telegram dates have one second resolution so that stage is coarse, all others use perf_counter_ns.
+        """
+        self.stats = stats
+        self.name = name
+        self.start = self.last = time.perf_counter_ns()
+        if received is not None:
+            stats.record(f"{name}.telegram", max(0.0, time.time() - received.timestamp()))
+
+    # time since the previous mark
+    def mark(self, stage):
+        now = time.perf_counter_ns()
+        self.stats.record(f"{self.name}.{stage}", (now - self.last) / 1e9)
+        self.last = now
+
+    # time since the command arrived
+    def finish(self, stage='total'):
+        self.stats.record(f"{self.name}.{stage}", (time.perf_counter_ns() - self.start) / 1e9)
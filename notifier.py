@@ -0,0 +1,103 @@
+# libraries
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter, TelegramError
+
+
+# Outbound Telegram messages, queued by trading code and sent by one background task
+class Notifier:
+
+    def __init__(self, chat_interval=1.0, global_rate=25, max_length=4096):
+        """
+        Each chat gets at most one message per chat_interval seconds, and all chats together get
+        global_rate per second. Everything queued for a chat in between is joined into one message.
+        Queuing with a key replaces the pending message with the same key, so only the latest survives.
+        """
+        self.chat_interval = chat_interval
+        self.global_interval = 1 / global_rate
+        self.max_length = max_length
+        self.pending = {} # chat_id -> [[key, text], ...] in queue order
+        self.next_send = {} # chat_id -> monotonic time of the next allowed message
+        self.bot = None
+        self.sent = 0
+        self.coalesced = 0
+        self.retries = 0
+        self._wake = asyncio.Event()
+        self._task = None
+
+    # never awaits, safe on the order path and inside tick callbacks
+    def send(self, chat_id, text, key=None):
+        messages = self.pending.setdefault(chat_id, [])
+        if key is not None:
+            for message in messages:
+                if message[0] == key:
+                    message[1] = text
+                    self.coalesced += 1
+                    return
+        messages.append([key, text])
+        self._wake.set()
+
+    def reply(self, update, text, key=None):
+        self.send(update.effective_chat.id, text, key)
+
+    def start(self, bot):
+        self.bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # best effort for whatever is still queued
+        for chat_id in list(self.pending):
+            await self._flush(chat_id)
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            ready = [chat_id for chat_id in self.pending if self.next_send.get(chat_id, 0) <= now]
+            if not ready:
+                timeout = min((self.next_send[chat_id] for chat_id in self.pending), default=None)
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), None if timeout is None else timeout - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            for chat_id in ready:
+                await self._flush(chat_id)
+                await asyncio.sleep(self.global_interval)
+
+    def _take(self, chat_id):
+        # as many queued messages as fit in one Telegram message, the rest stays queued
+        messages = self.pending.pop(chat_id)
+        texts, length = [], 0
+        while messages and (not texts or length + len(messages[0][1]) + 2 <= self.max_length):
+            text = messages.pop(0)[1]
+            texts.append(text)
+            length += len(text) + 2
+        if messages:
+            self.pending[chat_id] = messages
+        self.coalesced += len(texts) - 1
+        return texts
+
+    async def _flush(self, chat_id):
+        if chat_id not in self.pending:
+            return
+        texts = self._take(chat_id)
+        try:
+            await self.bot.send_message(chat_id=chat_id, text="\n\n".join(texts)[:self.max_length])
+            self.sent += 1
+            self.next_send[chat_id] = time.monotonic() + self.chat_interval
+        except RetryAfter as e:
+            # put the batch back in front and hold the chat for as long as Telegram asks
+            self.retries += 1
+            self.pending[chat_id] = [[None, text] for text in texts] + self.pending.get(chat_id, [])
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            self.next_send[chat_id] = time.monotonic() + retry_after
+        except TelegramError as e:
+            logging.error(f"Telegram notification to {chat_id} failed: {e}")
@@ -0,0 +1,264 @@
+# libraries
+import asyncio
+import bisect
+import logging
+import time
+
+# topic prefix of the KuCoin level 2 diff channel
+LEVEL2_PREFIX = "/market/level2:"
+
+
+# One side of the book as two parallel sorted arrays, best level last
+class BookSide:
+    __slots__ = ('sign', 'keys', 'sizes')
+
+    def __init__(self, bids):
+        """
+        Keys are prices for bids and negated prices for asks, so both sides sort ascending with the best
+        level at the end: top-of-book reads are O(1), and updates near the top only move the few levels above them.
+        """
+        self.sign = 1 if bids else -1
+        self.keys = []
+        self.sizes = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def load(self, levels):
+        levels = sorted(((self.sign * price, size) for price, size in levels if size > 0))
+        self.keys = [key for key, _ in levels]
+        self.sizes = [size for _, size in levels]
+
+    # absolute size of a level, 0 removes it
+    def set(self, price, size):
+        key = self.sign * price
+        keys = self.keys
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            if size > 0:
+                self.sizes[i] = size
+            else:
+                del keys[i], self.sizes[i]
+        elif size > 0:
+            keys.insert(i, key)
+            self.sizes.insert(i, size)
+
+    def best(self):
+        return (self.sign * self.keys[-1], self.sizes[-1]) if self.keys else None
+
+    # n-th level from the top, 0 is the best
+    def level(self, n):
+        if n >= len(self.keys):
+            return None
+        return self.sign * self.keys[-1 - n], self.sizes[-1 - n]
+
+    def top(self, n):
+        return [(self.sign * self.keys[i], self.sizes[i]) for i in range(len(self.keys) - 1, max(len(self.keys) - n, 0) - 1, -1)]
+
+    # (price, size) from the best level outwards
+    def __iter__(self):
+        sign, keys, sizes = self.sign, self.keys, self.sizes
+        for i in range(len(keys) - 1, -1, -1):
+            yield sign * keys[i], sizes[i]
+
+    def vwap(self, size):
+        """
+        (average price, worst price) of a market order taking size from this side, None when the side is too thin.
+        """
+        keys, sizes, sign = self.keys, self.sizes, self.sign
+        remaining = size
+        cost = 0.0
+        for i in range(len(keys) - 1, -1, -1):
+            price = sign * keys[i]
+            take = sizes[i] if sizes[i] < remaining else remaining
+            cost += take * price
+            remaining -= take
+            if remaining <= size * 1e-12:
+                return cost / size, price
+        return None
+
+    def size_at(self, price):
+        key = self.sign * price
+        i = bisect.bisect_left(self.keys, key)
+        return self.sizes[i] if i < len(self.keys) and self.keys[i] == key else 0.0
+
+
+# KuCoin GET /api/v3/market/orderbook/level2
+def kucoin_snapshot(response):
+    data = response['data']
+    return int(data['sequence']), [(float(p), float(s)) for p, s in data['bids']], [(float(p), float(s)) for p, s in data['asks']]
+
+
+# KuCoin /market/level2 message data, every change carries its own sequence
+def kucoin_diff(data):
+    changes = data['changes']
+    return (int(data['sequenceStart']), int(data['sequenceEnd']),
+            [(float(c[0]), float(c[1]), int(c[2])) for c in changes['bids']], [(float(c[0]), float(c[1]), int(c[2])) for c in changes['asks']])
+
+
+# Binance GET /api/v3/depth
+def binance_snapshot(response):
+    return response['lastUpdateId'], [(float(p), float(s)) for p, s in response['bids']], [(float(p), float(s)) for p, s in response['asks']]
+
+
+# Binance <symbol>@depth event, the changes have no sequence of their own and take the event's last one
+def binance_diff(data):
+    last = data['u']
+    return data['U'], last, [(float(p), float(s), last) for p, s in data['b']], [(float(p), float(s), last) for p, s in data['a']]
+
+
+# Position size risking Risk between entry and stop loss, with the entry at the expected fill of that size.
+# The stop-out loss is piecewise linear in the size, one segment per level, so walking the levels from the
+# best one solves it exactly: the answer lies on the first level where the loss reaches Risk.
+def risk_size(side, SL, P, Risk, f, book=None):
+    """
+    Returns (size, average fill, worst fill). Without a live book the whole size fills at P,
+    None when the book is too thin for the size or reaches through the stop loss.
+    """
+    d = 1 if side == 'buy' else -1
+    if book is None or not book.live():
+        return Risk / (SL*(f-d) + P*(f+d)), P, P
+
+    # loss of taking size for cost, with the entry and exit fees: (d+f)*cost + size*SL*(f-d)
+    size = cost = 0.0
+    for price, available in (book.asks if side == 'buy' else book.bids):
+        slope = d*(price - SL) + f*(price + SL)
+        if slope <= 0:
+            return None
+        take = (Risk - (d+f)*cost - size*SL*(f-d)) / slope
+        if take <= available:
+            # shaved by a rounding error so the loss never exceeds Risk
+            take *= 1 - 1e-12
+            size += take
+            cost += take * price
+            return size, cost / size, price
+        size += available
+        cost += available * price
+    return None
+
+
+# Local level 2 book built from a REST snapshot and kept current by sequenced diffs
+class OrderBook:
+
+    def __init__(self, symbol, snapshot, parse_snapshot, parse_diff, max_buffer=10_000, max_staleness=5.0):
+        """
+        snapshot is a coroutine function returning the raw REST depth, the parsers turn exchange messages into
+        (sequence, bids, asks) and (first, last, bids, asks) with (price, size, sequence) changes. Diffs are buffered while a snapshot loads,
+        and a gap in the sequence drops the book and resyncs it from a new snapshot. A book without a diff for
+        max_staleness seconds is not live, its feed may have dropped without a gap showing yet.
+        """
+        self.symbol = symbol
+        self.snapshot = snapshot
+        self.parse_snapshot = parse_snapshot
+        self.parse_diff = parse_diff
+        self.max_buffer = max_buffer
+        self.max_staleness = max_staleness
+        self.bids = BookSide(bids=True)
+        self.asks = BookSide(bids=False)
+        self.sequence = None
+        self.synced = False
+        self.updated = None
+        self.snapshots = 0
+        self._buffer = []
+        self._task = None
+
+    # ============ Queries ============
+
+    # synced and recently updated, safe to size orders against
+    def live(self):
+        return self.synced and self.updated is not None and time.monotonic() - self.updated <= self.max_staleness
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def mid(self):
+        bid, ask = self.bids.best(), self.asks.best()
+        return (bid[0] + ask[0]) / 2 if bid and ask else None
+
+    def depth(self, n=10):
+        return {'bids': self.bids.top(n), 'asks': self.asks.top(n)}
+
+    # expected (average, worst) price of a market order, buys take the asks and sells the bids
+    def fill(self, side, size):
+        if not self.live() or size <= 0:
+            return None
+        return (self.asks if side == 'buy' else self.bids).vwap(size)
+
+    # ============ Updates ============
+
+    # stream callback, message data of the depth channel
+    def update(self, data):
+        first, last, bids, asks = self.parse_diff(data)
+        if not self.synced:
+            self._buffer.append((first, last, bids, asks))
+            if len(self._buffer) > self.max_buffer:
+                self._buffer.pop(0)
+            self.resync()
+            return
+        if not self._apply(first, last, bids, asks):
+            logging.warning(f"{self.symbol} book gap after {self.sequence}, next diff starts at {first}, resyncing")
+            self.synced = False
+            self._buffer = [(first, last, bids, asks)]
+            self.resync()
+
+    def _apply(self, first, last, bids, asks):
+        if last <= self.sequence:
+            return True # already in the snapshot
+        if first > self.sequence + 1:
+            return False
+        # a diff straddling the snapshot holds changes the snapshot already has
+        sequence = self.sequence
+        for price, size, seq in bids:
+            if seq > sequence:
+                self.bids.set(price, size)
+        for price, size, seq in asks:
+            if seq > sequence:
+                self.asks.set(price, size)
+        self.sequence = last
+        self.updated = time.monotonic()
+        return True
+
+    def load(self, sequence, bids, asks):
+        self.bids.load(bids)
+        self.asks.load(asks)
+        self.sequence = sequence
+        self.updated = time.monotonic()
+
+        # replay what arrived while the snapshot was in flight
+        buffered, self._buffer = self._buffer, []
+        for i, diff in enumerate(buffered):
+            if not self._apply(*diff):
+                self._buffer = buffered[i:]
+                return False
+        self.synced = True
+        return True
+
+    # ============ Snapshots ============
+
+    def resync(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._resync())
+
+    async def _resync(self):
+        delay = 0.25
+        while not self.synced:
+            try:
+                if self.load(*self.parse_snapshot(await self.snapshot(self.symbol))):
+                    self.snapshots += 1
+                    return
+                # the snapshot is older than the first buffered diff, retry with a newer one
+                logging.warning(f"{self.symbol} snapshot {self.sequence} does not reach the buffered diffs")
+            except Exception as e:
+                logging.error(f"{self.symbol} book snapshot failed: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.synced = False
+        self._buffer = []
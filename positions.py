@@ -0,0 +1,126 @@
+# libraries
+import bisect
+import itertools
+import time
+
+from exit_logic import check_exit
+
+OPEN = 'open'
+CLOSED = 'closed'
+
+
+# One monitored position and the exchange orders protecting it
+class Position:
+    __slots__ = ('id', 'owner', 'symbol', 'side', 'size', 'entry_price', 'take_profit', 'stop_loss', 'leveraged',
+                 'entry_id', 'take_profit_id', 'stop_loss_id', 'exit_order', 'watched', 'state', 'opened', 'payload')
+
+    def __init__(self, id, owner, symbol, side, size, entry_price, take_profit, stop_loss, leveraged=False,
+                 entry_id=None, take_profit_id=None, stop_loss_id=None, exit_order=None, watched=True, payload=None):
+        self.id = id
+        self.owner = owner
+        self.symbol = symbol
+        self.side = side
+        self.size = size
+        self.entry_price = entry_price
+        self.take_profit = take_profit
+        self.stop_loss = stop_loss
+        self.leveraged = leveraged
+        self.entry_id = entry_id
+        self.take_profit_id = take_profit_id
+        self.stop_loss_id = stop_loss_id
+        self.exit_order = exit_order # pre-built market exit, sent as is when either level is hit
+        self.watched = watched # exits decided by price, False when exchange orders report their own fills
+        self.state = OPEN
+        self.opened = time.time()
+        self.payload = payload
+
+    def __repr__(self):
+        return f"Position({self.id} {self.side} {self.size} {self.symbol} TP {self.take_profit} SL {self.stop_loss} {self.state})"
+
+
+# Open positions of every user, evaluated together on each tick of the shared feed
+class PositionBook:
+
+    def __init__(self):
+        """
+        Each position puts one level in the upper array (fires when the price rises to it) and one in the
+        lower array (fires when it falls to it): TP up and SL down for longs, the other way round for shorts.
+        Both arrays stay sorted, so a tick costs two bisects plus the positions it actually closes.
+        Unwatched positions are only kept for lookup, their exits come from the exchange order events.
+        """
+        self.upper_levels, self.upper_positions = [], []
+        self.lower_levels, self.lower_positions = [], []
+        self.positions = {}
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        return iter(list(self.positions.values()))
+
+    def open(self, owner, symbol, side, size, entry_price, take_profit, stop_loss, **kwargs):
+        position = Position(next(self._ids), owner, symbol, side, size, entry_price, take_profit, stop_loss, **kwargs)
+        self.positions[position.id] = position
+        if not position.watched:
+            return position
+        upper, lower = (take_profit, stop_loss) if side == 'buy' else (stop_loss, take_profit)
+        self._insert(self.upper_levels, self.upper_positions, upper, position)
+        self._insert(self.lower_levels, self.lower_positions, lower, position)
+        return position
+
+    def get(self, position_id):
+        return self.positions.get(position_id)
+
+    def owned(self, owner):
+        return [position for position in self.positions.values() if position.owner == owner]
+
+    def remove(self, position_id):
+        position = self.positions.pop(position_id, None)
+        if position is None:
+            return None
+        if position.watched:
+            upper, lower = (position.take_profit, position.stop_loss) if position.side == 'buy' else (position.stop_loss, position.take_profit)
+            self._delete(self.upper_levels, self.upper_positions, upper, position)
+            self._delete(self.lower_levels, self.lower_positions, lower, position)
+        position.state = CLOSED
+        return position
+
+    def remove_owner(self, owner):
+        return [self.remove(position.id) for position in self.owned(owner)]
+
+    def on_price(self, price):
+        """
+        Returns (position, hit) for every position whose take profit or stop loss the price reached,
+        with hit as check_exit decides it, and drops those positions from the book.
+        """
+        hits = []
+
+        k = bisect.bisect_right(self.upper_levels, price)
+        if k:
+            hits.extend(self.upper_positions[:k])
+
+        k = bisect.bisect_left(self.lower_levels, price)
+        if k < len(self.lower_levels):
+            hits.extend(self.lower_positions[k:])
+
+        fired = []
+        for position in hits:
+            if position.state is OPEN:
+                fired.append((self.remove(position.id), check_exit(position.side, price, position.take_profit, position.stop_loss)))
+        return fired
+
+    # ============ Sorted levels ============
+
+    @staticmethod
+    def _insert(levels, positions, level, position):
+        i = bisect.bisect_right(levels, level)
+        levels.insert(i, level)
+        positions.insert(i, position)
+
+    @staticmethod
+    def _delete(levels, positions, level, position):
+        i = bisect.bisect_left(levels, level)
+        while positions[i] is not position:
+            i += 1
+        del levels[i], positions[i]
@@ -0,0 +1,39 @@
+# libraries
+import time
+
+
+# Last price and best bid/ask kept current by a ticker stream
+class PriceCache:
+
+    def __init__(self, max_staleness: float = 2.0):
+
+        self.max_staleness = max_staleness
+        self.last = None
+        self.best_bid = None
+        self.best_ask = None
+        self.updated = None
+
+    # ticker stream callback
+    def update(self, tick):
+        self.last = tick.price
+        self.best_bid = tick.best_bid
+        self.best_ask = tick.best_ask
+        self.updated = time.monotonic()
+
+    def age(self):
+        if self.updated is None:
+            return None
+        return time.monotonic() - self.updated
+
+    def fresh(self, max_staleness=None):
+        age = self.age()
+        limit = self.max_staleness if max_staleness is None else max_staleness
+        return age is not None and age <= limit
+
+    # last price, or None when the cache is older than max_staleness seconds
+    def price(self, max_staleness=None):
+        return self.last if self.fresh(max_staleness) else None
+
+    # best bid and ask, or None when the cache is older than max_staleness seconds
+    def quote(self, max_staleness=None):
+        return (self.best_bid, self.best_ask) if self.fresh(max_staleness) else None
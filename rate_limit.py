@@ -0,0 +1,127 @@
+# libraries
+import asyncio
+import logging
+import time
+from collections import deque
+
+# request priorities, lower goes first
+CRITICAL = 0 # orders, stop orders and cancels
+NORMAL = 1 # prices and stream tokens
+LOW = 2 # account, order and exchange information
+
+PRIORITIES = (CRITICAL, NORMAL, LOW)
+
+
+# Exchange weight budget refilled continuously, capacity per window seconds
+class TokenBucket:
+    __slots__ = ('capacity', 'rate', 'tokens', 'stamp')
+
+    def __init__(self, capacity, window):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.tokens = float(capacity)
+        self.stamp = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    # takes weight if that leaves at least floor tokens
+    def take(self, weight, floor=0.0):
+        self.refill(time.monotonic())
+        if self.tokens - weight < floor:
+            return False
+        self.tokens -= weight
+        return True
+
+    # seconds until take(weight, floor) can succeed
+    def wait(self, weight, floor=0.0):
+        return max(0.0, (weight + floor - self.tokens) / self.rate)
+
+
+# One exchange rate limit shared by every request that counts against it
+class RateLimiter:
+
+    def __init__(self, capacity, window, reserve=0.2, name=None):
+        """
+        Requests wait in strict priority order, and only critical ones may use the last reserve share of the
+        capacity, so orders and cancels never queue behind informational calls. The bucket is pulled down to
+        what the exchange reports in its rate-limit headers, and held empty for as long as it asks after a 429.
+        """
+        self.name = name
+        self.bucket = TokenBucket(capacity, window)
+        self.reserve = capacity * reserve
+        self.waiters = {priority: deque() for priority in PRIORITIES}
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._timer = None
+
+    def _floor(self, priority):
+        return 0.0 if priority == CRITICAL else self.reserve
+
+    def _ready(self, weight, priority):
+        return time.monotonic() >= self.paused_until and self.bucket.take(weight, self._floor(priority))
+
+    async def acquire(self, weight=1, priority=NORMAL):
+        # nothing of the same or higher priority waiting, go straight through
+        if not any(self.waiters[p] for p in PRIORITIES if p <= priority) and self._ready(weight, priority):
+            return
+        self.throttled += 1
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[priority].append((weight, future))
+        self._schedule(0)
+        await future
+
+    def _schedule(self, delay):
+        # keep the earliest timer, a critical waiter must not sit behind the long wait of a low one
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer is not None:
+            if self._timer.when() <= when:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._drain)
+
+    def _drain(self):
+        self._timer = None
+        for priority in PRIORITIES:
+            queue = self.waiters[priority]
+            while queue:
+                weight, future = queue[0]
+                if future.done():
+                    queue.popleft()
+                    continue
+                if not self._ready(weight, priority):
+                    # lower priorities keep waiting behind this one
+                    delay = max(self.paused_until - time.monotonic(), self.bucket.wait(weight, self._floor(priority)))
+                    return self._schedule(max(delay, 0.001))
+                queue.popleft()
+                future.set_result(None)
+
+    # ============ Exchange feedback ============
+
+    def sync(self, remaining=None, used=None, reset=None):
+        """
+        remaining or used is the exchange's count for the current window, reset the seconds until it restarts.
+        """
+        if used is not None:
+            remaining = self.bucket.capacity - used
+        if remaining is None:
+            return
+        self.bucket.refill(time.monotonic())
+        self.bucket.tokens = min(self.bucket.tokens, remaining)
+        if remaining <= 0 and reset:
+            self.pause(reset)
+
+    def pause(self, seconds):
+        logging.warning(f"{self.name or 'Rate'} limit reached, holding requests for {seconds:.1f}s")
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.bucket.tokens = min(self.bucket.tokens, 0.0)
+
+
+# (pool, weight, priority) of a request, from rows of (method, path prefix, pool, weight, priority)
+def endpoint_limit(table, method, path, default):
+    for row_method, prefix, pool, weight, priority in table:
+        if (row_method is None or row_method == method) and path.startswith(prefix):
+            return pool, weight, priority
+    return default
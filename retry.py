@@ -0,0 +1,20 @@
+# libraries
+import asyncio
+import logging
+
+
+# await request() and parse its response, retried with exponential backoff
+async def retry(request, parse=None, attempts=5, delay=0.25):
+    """
+    Startup requests go through here so a transient exchange error during a restart
+    costs a few hundred milliseconds instead of the process.
+    """
+    for attempt in range(attempts):
+        try:
+            response = await request()
+            return parse(response) if parse is not None else response
+        except Exception as e:
+            if attempt == attempts - 1:
+                raise
+            logging.warning(f"{getattr(request, '__qualname__', request)} failed ({e}), retrying")
+            await asyncio.sleep(delay * 2 ** attempt)
@@ -0,0 +1,146 @@
+# libraries
+import asyncio
+import logging
+import math
+
+
+# decimals of an increment as the exchange sends it, e.g. "0.00001000" -> 5
+def decimals(increment: str) -> int:
+    increment = increment.rstrip('0')
+    return len(increment.split('.')[1]) if '.' in increment else 0
+
+
+# Trading rules of one pair, steps are kept inverted so every rounding is a multiply and a floor
+class SymbolInfo:
+
+    __slots__ = ('symbol', 'base', 'quote', 'size_step', 'price_step', 'funds_step', 'min_size', 'min_funds',
+                 '_size_inv', '_price_inv', '_funds_inv', '_size_decimals', '_price_decimals', '_funds_decimals')
+
+    def __init__(self, symbol, base, quote, size_step, price_step, funds_step, min_size="0", min_funds="0"):
+        """
+        Steps are the exchange strings (lot size, tick size and quote increment), min_funds is the minimum notional.
+        """
+        self.symbol = symbol
+        self.base = base
+        self.quote = quote
+        self.size_step = float(size_step)
+        self.price_step = float(price_step)
+        self.funds_step = float(funds_step)
+        self.min_size = float(min_size)
+        self.min_funds = float(min_funds)
+        self._size_inv = 1 / self.size_step
+        self._price_inv = 1 / self.price_step
+        self._funds_inv = 1 / self.funds_step
+        self._size_decimals = decimals(size_step)
+        self._price_decimals = decimals(price_step)
+        self._funds_decimals = decimals(funds_step)
+
+    # sizes and funds round down so an order never exceeds what was priced, the epsilon absorbs float noise
+    def round_size(self, size):
+        return round(math.floor(size * self._size_inv + 1e-9) * self.size_step, self._size_decimals)
+
+    # up to the next step, for repaying a liability in full
+    def round_size_up(self, size):
+        return round(math.ceil(size * self._size_inv - 1e-9) * self.size_step, self._size_decimals)
+
+    def round_funds(self, funds):
+        return round(math.floor(funds * self._funds_inv + 1e-9) * self.funds_step, self._funds_decimals)
+
+    def round_price(self, price):
+        return round(round(price * self._price_inv) * self.price_step, self._price_decimals)
+
+    # order strings, rounded to the step and printed with exactly its decimals
+    def format_size(self, size):
+        return f"{self.round_size(size):.{self._size_decimals}f}"
+
+    def format_size_up(self, size):
+        return f"{self.round_size_up(size):.{self._size_decimals}f}"
+
+    def format_funds(self, funds):
+        return f"{self.round_funds(funds):.{self._funds_decimals}f}"
+
+    def format_price(self, price):
+        return f"{self.round_price(price):.{self._price_decimals}f}"
+
+    def tradable(self, size, price):
+        size = self.round_size(size)
+        return size > 0 and size >= self.min_size and size * price >= self.min_funds
+
+    def __repr__(self):
+        return f"SymbolInfo({self.symbol}, size_step={self.size_step}, price_step={self.price_step}, min_funds={self.min_funds})"
+
+
+# KuCoin GET /api/v2/symbols
+def parse_kucoin(response):
+    return [
+        SymbolInfo(s['symbol'], s['baseCurrency'], s['quoteCurrency'], s['baseIncrement'], s['priceIncrement'],
+                   s['quoteIncrement'], s['baseMinSize'], s.get('minFunds') or s['quoteMinSize'])
+        for s in response['data'] if s.get('enableTrading', True)
+    ]
+
+
+def quote_step(precision):
+    return f"{10.0 ** -precision:.{precision}f}"
+
+
+# Binance GET /api/v3/exchangeInfo
+def parse_binance(response):
+    result = []
+    for s in response['symbols']:
+        if s.get('status', 'TRADING') != 'TRADING':
+            continue
+        filters = {f['filterType']: f for f in s['filters']}
+        lot = filters['LOT_SIZE']
+        notional = filters.get('NOTIONAL') or filters.get('MIN_NOTIONAL') or {}
+        result.append(SymbolInfo(s['symbol'], s['baseAsset'], s['quoteAsset'], lot['stepSize'], filters['PRICE_FILTER']['tickSize'],
+                                 quote_step(s.get('quoteAssetPrecision', 8)), lot['minQty'], notional.get('minNotional', "0")))
+    return result
+
+
+# Every tradable pair of one exchange, loaded once and refreshed in the background
+class SymbolRegistry:
+
+    def __init__(self, fetch, parse, refresh_interval=3600):
+        """
+        fetch is a coroutine function returning the raw exchange response, parse turns it into SymbolInfo records.
+        """
+        self.fetch = fetch
+        self.parse = parse
+        self.refresh_interval = refresh_interval
+        self.symbols = {}
+        self._task = None
+
+    async def refresh(self):
+        # swapped in one assignment, lookups never see a half-built table
+        self.symbols = {info.symbol: info for info in self.parse(await self.fetch())}
+        return len(self.symbols)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Symbol refresh failed, keeping the previous rules: {e}")
+
+    async def start(self):
+        await self.refresh()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def get(self, symbol):
+        return self.symbols.get(symbol)
+
+    def __getitem__(self, symbol):
+        return self.symbols[symbol]
+
+    def __contains__(self, symbol):
+        return symbol in self.symbols
+
+    def __len__(self):
+        return len(self.symbols)
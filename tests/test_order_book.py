@@ -0,0 +1,71 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_book import OrderBook, kucoin_diff, risk_size
+
+
+def synced_book(bids, asks, sequence=100):
+    book = OrderBook('BTC-USDT', None, None, None)
+    book.load(sequence, bids, asks)
+    return book
+
+
+# loss at the stop of size bought or sold at an average of E, with both fees
+def loss(side, n, E, SL, f):
+    d = 1 if side == 'buy' else -1
+    return d*n*(E - SL) + f*n*(E + SL)
+
+
+def test_risk_size_thin_book_buy():
+    # tiny levels spread wide, the first guess at P walks deep into the asks
+    book = synced_book([(99.0, 1.0)], [(100.0, 0.01), (101.0, 0.01), (103.0, 0.02), (108.0, 5.0)])
+    n, E, worst = risk_size('buy', 90.0, 100.0, 1.0, 0.001, book)
+    assert loss('buy', n, E, 90.0, 0.001) <= 1.0
+    assert abs(loss('buy', n, E, 90.0, 0.001) - 1.0) < 1e-9
+    # the reported fill is what the book gives for that size
+    average, last = book.fill('buy', n)
+    assert abs(average - E) < 1e-9 and last == worst == 108.0
+
+
+def test_risk_size_thin_book_sell():
+    book = synced_book([(100.0, 0.005), (99.5, 0.01), (97.0, 0.02), (95.0, 3.0)], [(101.0, 1.0)])
+    n, E, worst = risk_size('sell', 110.0, 100.0, 1.0, 0.001, book)
+    assert loss('sell', n, E, 110.0, 0.001) <= 1.0
+    assert abs(loss('sell', n, E, 110.0, 0.001) - 1.0) < 1e-9
+
+
+def test_risk_size_book_too_thin_or_through_stop():
+    # not enough size before the risk is reached
+    assert risk_size('buy', 90.0, 100.0, 1.0, 0.001, synced_book([(99.0, 1.0)], [(100.0, 0.01)])) is None
+    # the stop loss sits above the deeper asks, buying them loses on every unit
+    assert risk_size('buy', 100.5, 100.0, 1.0, 0.001, synced_book([(99.0, 1.0)], [(100.0, 0.01), (101.0, 5.0)])) is None
+
+
+def test_risk_size_without_book():
+    n, E, worst = risk_size('buy', 90.0, 100.0, 1.0, 0.001)
+    assert E == worst == 100.0
+    assert abs(loss('buy', n, E, 90.0, 0.001) - 1.0) < 1e-9
+
+
+def level2(first, last, bids=(), asks=()):
+    return {'sequenceStart': first, 'sequenceEnd': last, 'changes': {'bids': [list(c) for c in bids], 'asks': [list(c) for c in asks]}}
+
+
+def test_diff_straddling_snapshot_skips_old_changes():
+    book = OrderBook('BTC-USDT', None, None, kucoin_diff)
+    book.load(105, [(100.0, 1.0)], [(101.0, 2.0)])
+    # 103 and 104 are already in the snapshot, replaying them would bring back stale sizes
+    book.update(level2(103, 107, bids=[('100', '5', '103'), ('99', '3', '106')], asks=[('101', '0', '104'), ('102', '4', '107')]))
+    assert book.synced and book.sequence == 107
+    assert book.bids.size_at(100.0) == 1.0 and book.bids.size_at(99.0) == 3.0
+    assert book.asks.size_at(101.0) == 2.0 and book.asks.size_at(102.0) == 4.0
+
+
+def test_stale_book_falls_back_to_last_price():
+    book = synced_book([(99.0, 1.0)], [(100.0, 0.01), (108.0, 5.0)])
+    # no diff since, the feed may have dropped without a gap showing
+    book.updated -= book.max_staleness + 1
+    assert not book.live() and book.fill('buy', 0.01) is None
+    n, E, worst = risk_size('buy', 90.0, 100.0, 1.0, 0.001, book)
+    assert E == worst == 100.0
@@ -0,0 +1,57 @@
+import asyncio, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import CRITICAL, LOW, NORMAL, RateLimiter
+
+
+def spent_limiter():
+    # 10 tokens a second, 6 of them reserved for critical requests
+    limiter = RateLimiter(30, 3, reserve=0.2)
+    limiter.bucket.tokens = 0.0
+    return limiter
+
+
+async def timed(limiter, weight, priority, start):
+    await limiter.acquire(weight, priority)
+    return time.monotonic() - start
+
+
+def test_critical_does_not_wait_behind_low_timer():
+    async def main():
+        limiter = spent_limiter()
+        start = time.monotonic()
+        low = asyncio.create_task(timed(limiter, 15, LOW, start))
+        await asyncio.sleep(0.01)
+        # armed for the low request, about 2.1 s away
+        critical = asyncio.create_task(timed(limiter, 3, CRITICAL, start))
+        return await critical, await low
+
+    critical, low = asyncio.run(main())
+    assert critical < 0.6
+    assert critical < low
+
+
+def test_priority_order():
+    async def main():
+        limiter = spent_limiter()
+        done = []
+
+        async def request(name, weight, priority):
+            await limiter.acquire(weight, priority)
+            done.append(name)
+
+        await asyncio.gather(request('low', 1, LOW), request('normal', 1, NORMAL), request('critical', 1, CRITICAL))
+        return done
+
+    assert asyncio.run(main()) == ['critical', 'normal', 'low']
+
+
+def test_pause_holds_every_priority():
+    async def main():
+        limiter = RateLimiter(30, 3)
+        limiter.pause(0.3)
+        start = time.monotonic()
+        return await timed(limiter, 1, CRITICAL, start)
+
+    assert asyncio.run(main()) >= 0.25
@@ -0,0 +1,154 @@
+# libraries
+import mmap
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+# fixed-width tick record, 48 bytes, timestamps in nanoseconds since the epoch
+TICK_DTYPE = np.dtype([
+    ('exchange_ns', '<i8'),
+    ('local_ns', '<i8'),
+    ('price', '<f8'),
+    ('size', '<f8'),
+    ('best_bid', '<f8'),
+    ('best_ask', '<f8')
+])
+
+# file header: magic, record size and the number of committed records
+MAGIC = b'TICKS001'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('record_size', '<u8'), ('count', '<u8')])
+HEADER_SIZE = 64
+EXTENSION = '.ticks'
+DAY_NS = 86_400 * 10**9
+
+
+def day_of(ns):
+    return datetime.fromtimestamp(ns // DAY_NS * 86_400, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def partition(root, exchange, symbol):
+    return os.path.join(root, exchange, symbol)
+
+
+# One day file, preallocated and memory-mapped, grown by doubling
+class DayFile:
+
+    def __init__(self, path, capacity=1 << 20):
+
+        self.path = path
+        new = not os.path.exists(path)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        if new:
+            os.ftruncate(self.fd, HEADER_SIZE + capacity * TICK_DTYPE.itemsize)
+        self._map()
+
+        if new:
+            self.header['magic'] = MAGIC
+            self.header['record_size'] = TICK_DTYPE.itemsize
+            self.header['count'] = 0
+        elif self.header['magic'] != MAGIC or self.header['record_size'] != TICK_DTYPE.itemsize:
+            raise ValueError(f"{path} is not a tick file")
+        self.count = int(self.header['count'])
+
+    def _map(self):
+        size = os.fstat(self.fd).st_size
+        self.mm = mmap.mmap(self.fd, size)
+        self.header = np.frombuffer(self.mm, dtype=HEADER_DTYPE, count=1)[0]
+        self.records = np.frombuffer(self.mm, dtype=TICK_DTYPE, offset=HEADER_SIZE, count=(size - HEADER_SIZE) // TICK_DTYPE.itemsize)
+        self.capacity = len(self.records)
+
+    def _grow(self):
+        del self.header, self.records
+        self.mm.close()
+        os.ftruncate(self.fd, HEADER_SIZE + 2 * self.capacity * TICK_DTYPE.itemsize)
+        self._map()
+
+    def append(self, record):
+        if self.count == self.capacity:
+            self._grow()
+        self.records[self.count] = record
+        self.count += 1
+        # the record is written before it is counted, readers never see a partial tick
+        self.header['count'] = self.count
+
+    # blocking msync that holds the GIL, for tools and tests only: the live recorders leave write-back
+    # to the page cache, which keeps MAP_SHARED writes after a crash of the process
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        del self.header, self.records
+        self.mm.close()
+        # hand back the unused preallocation
+        os.ftruncate(self.fd, HEADER_SIZE + self.count * TICK_DTYPE.itemsize)
+        os.close(self.fd)
+
+
+# Append-only tick recorder for one exchange and symbol, partitioned by UTC day of the exchange timestamp
+class TickWriter:
+
+    def __init__(self, root, exchange, symbol, capacity=1 << 20):
+
+        self.directory = partition(root, exchange, symbol)
+        self.capacity = capacity
+        self.file = None
+        self.day = None
+        self._day_start = self._day_end = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def append(self, exchange_ns, price, size, best_bid, best_ask, local_ns=None):
+
+        if local_ns is None:
+            local_ns = time.time_ns()
+
+        # day boundaries are cached, only a tick outside the current day touches the calendar
+        if not self._day_start <= exchange_ns < self._day_end:
+            self._roll(exchange_ns)
+
+        self.file.append((exchange_ns, local_ns, price, size, best_bid, best_ask))
+
+    def _roll(self, exchange_ns):
+        if self.file is not None:
+            self.file.close()
+        self.day = day_of(exchange_ns)
+        self._day_start = exchange_ns // DAY_NS * DAY_NS
+        self._day_end = self._day_start + DAY_NS
+        self.file = DayFile(os.path.join(self.directory, self.day + EXTENSION), self.capacity)
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.day = None
+            self._day_start = self._day_end = 0
+
+
+# zero-copy read-only view of the committed records of one day file
+def read_day(path):
+    header = np.memmap(path, dtype=HEADER_DTYPE, mode='r', shape=(1,))[0]
+    if header['magic'] != MAGIC:
+        raise ValueError(f"{path} is not a tick file")
+    count = int(header['count'])
+    if count == 0:
+        return np.empty(0, dtype=TICK_DTYPE)
+    return np.memmap(path, dtype=TICK_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+# day files of a partition, optionally limited to an inclusive range of 'YYYY-MM-DD' days
+def days(directory, start=None, end=None):
+    if not os.path.isdir(directory):
+        return []
+    found = sorted(name[:-len(EXTENSION)] for name in os.listdir(directory) if name.endswith(EXTENSION))
+    return [day for day in found if (start is None or day >= start) and (end is None or day <= end)]
+
+
+# one view per day file, in time order
+def read_range(directory, start=None, end=None):
+    return [read_day(os.path.join(directory, day + EXTENSION)) for day in days(directory, start, end)]